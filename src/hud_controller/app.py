@@ -7,14 +7,21 @@ from mcp.server.fastmcp import FastMCP
 from pydantic import Field
 
 import hud_controller.extractors.pipeline_tasks
-from hud_controller.utils import import_submodules
+from hud_controller.utils import import_submodules, queue_logging
 
+from .go_cache import prewarm_in_background, prewarm_stats
+from .grading_runner import target_packages
+from .impact import impact_targets
 from .setup import setup_codebase
+from .setup_metrics import summary as setup_metrics_summary
 from .spec import PROBLEM_REGISTRY, EnvironmentState, Grade, ProblemSpec
+from .tasks import task_files
 from .tools.base import ToolResult
 
 from .tools.bash import BashTool
 from .tools.edit import Command, EditTool
+from .trash import default_trash
+from .workspace_pool import WorkspacePool
 
 logger = logging.getLogger(__name__)
 
@@ -59,23 +66,76 @@ def _get_spec(problem_id: str) -> ProblemSpec:
             return spec
     raise ValueError(f"No problem found for id: {problem_id}")
 
+workspace_pool = WorkspacePool(
+    resolve=_get_spec,
+    registry_ids=lambda: [spec.id for spec in PROBLEM_REGISTRY],
+)
+
 @mcp.tool()
 async def setup_problem(problem_id: str = Field(description="Task ID")) -> str:
     """Initialize the environment (Time Travel + Build Config)."""
     spec = _get_spec(problem_id)
     logger.info(f"Setting up problem: {problem_id}")
-    await asyncio.to_thread(setup_codebase, spec.base, spec.test, spec.golden)
+    if not await workspace_pool.take(problem_id):
+        await setup_codebase(spec.base, spec.test, spec.golden)
+    await workspace_pool.advance(problem_id)
+    prewarm_in_background(problem_id)
     return spec_to_statement(spec)
 
+@mcp.tool()
+async def prewarm_workspaces(
+    problem_ids: list[str] = Field(description="Upcoming task IDs, in the order they will be set up"),
+) -> dict:
+    """Queue problems for the background workspace pool (needs WORKSPACE_POOL_SIZE > 0)."""
+    for problem_id in problem_ids:
+        _get_spec(problem_id)
+    await workspace_pool.enqueue(problem_ids)
+    return workspace_pool.stats()
+
+@mcp.tool()
+async def trash_stats() -> dict:
+    """Report the background deletion backlog of old workspaces."""
+    return default_trash().stats()
+
+@mcp.tool()
+async def workspace_pool_stats() -> dict:
+    """Report workspace pool hits, misses and build times."""
+    return workspace_pool.stats()
+
+@mcp.tool()
+async def setup_metrics() -> dict:
+    """Per-phase wall/CPU time, bytes written and file counts, aggregated across setups."""
+    return setup_metrics_summary()
+
+@mcp.tool()
+async def go_prewarm_stats() -> dict:
+    """Report Go build cache prewarm runs and their cache hit ratios."""
+    return prewarm_stats()
+
+@mcp.tool()
+async def affected_packages(problem_id: str = Field(description="Task ID")) -> dict:
+    """List the Go packages your changes so far affect, i.e. what grading in impact mode would test."""
+    spec = _get_spec(problem_id)
+    repo_path = os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+    packages = target_packages(task_files(problem_id), repo_path)
+    impact = await asyncio.to_thread(impact_targets, spec.base, spec.golden, repo_path, packages)
+    if impact is None:
+        return {"impact_analysis": False, "packages": packages}
+    return {"impact_analysis": True, **impact}
+
 @mcp.tool()
 async def grade_problem(problem_id: str) -> Grade:
     """Run tests and return the grade."""
     spec = _get_spec(problem_id)
-    state = EnvironmentState()
+    state = EnvironmentState(config=spec.config, problem_id=spec.id)
     return await asyncio.to_thread(spec.solution_fn, state)
 
 @click.command()
 def main():
+    # Grading threads log heavily; route the package's records through a
+    # queue to the handlers FastMCP installed, once for the server's life.
+    if os.environ.get("GRADING_LOG_QUEUE", "1") == "1":
+        queue_logging()
     mcp.run(transport="stdio")
 
 if __name__ == "__main__":
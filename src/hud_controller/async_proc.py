@@ -0,0 +1,120 @@
+"""Cancellable asyncio subprocess helpers used by workspace setup."""
+
+import asyncio
+import logging
+import os
+import signal
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+
+class CommandError(subprocess.CalledProcessError):
+    """A command exited non-zero; carries decoded stdout/stderr like CalledProcessError."""
+
+    def __str__(self):
+        stderr = self.stderr.decode(errors="replace") if isinstance(self.stderr, bytes) else self.stderr
+        return f"{super().__str__()}\n{(stderr or '').strip()}"
+
+
+def kill_group(proc: asyncio.subprocess.Process | subprocess.Popen):
+    """SIGKILL the process group a child was started in (see start_new_session)."""
+    if proc.returncode is not None:
+        return
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+async def _reap(procs: list[asyncio.subprocess.Process]):
+    for proc in procs:
+        kill_group(proc)
+    # Shielded so a second cancellation cannot leave zombies behind.
+    await asyncio.shield(asyncio.gather(*(proc.wait() for proc in procs)))
+
+
+async def run(
+    *cmd: str,
+    cwd: str | None = None,
+    env: dict[str, str] | None = None,
+    check: bool = True,
+    **popen_kwargs,
+) -> tuple[int, bytes, bytes]:
+    """
+    Run a command without a shell and return (returncode, stdout, stderr).
+
+    The child gets its own session so that cancelling the awaiting task kills
+    it together with anything it spawned.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,
+        **popen_kwargs,
+    )
+    try:
+        stdout, stderr = await proc.communicate()
+    except asyncio.CancelledError:
+        await _reap([proc])
+        raise
+
+    if check and proc.returncode != 0:
+        logger.error(f"Command failed: {list(cmd)}\nStderr: {stderr.decode(errors='replace')}")
+        raise CommandError(proc.returncode, list(cmd), stdout, stderr)
+    return proc.returncode, stdout, stderr
+
+
+async def run_pipe(
+    producer: list[str],
+    consumer: list[str],
+    producer_kwargs: dict | None = None,
+    consumer_kwargs: dict | None = None,
+) -> tuple[int, int, bytes, bytes]:
+    """
+    Stream producer's stdout into consumer's stdin through an OS pipe.
+
+    Data never passes through Python. Returns (producer returncode, consumer
+    returncode, consumer stdout, combined stderr). Both children are killed
+    if the awaiting task is cancelled.
+    """
+    read_fd, write_fd = os.pipe()
+    procs = []
+    try:
+        procs.append(await asyncio.create_subprocess_exec(
+            *producer,
+            stdin=subprocess.DEVNULL,
+            stdout=write_fd,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            **(producer_kwargs or {}),
+        ))
+        procs.append(await asyncio.create_subprocess_exec(
+            *consumer,
+            stdin=read_fd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            start_new_session=True,
+            **(consumer_kwargs or {}),
+        ))
+    except BaseException:
+        os.close(read_fd)
+        os.close(write_fd)
+        await _reap(procs)
+        raise
+    os.close(read_fd)
+    os.close(write_fd)
+
+    first, second = procs
+    try:
+        (_, producer_err), (consumer_out, consumer_err) = await asyncio.gather(
+            first.communicate(), second.communicate()
+        )
+    except asyncio.CancelledError:
+        await _reap(procs)
+        raise
+    return first.returncode, second.returncode, consumer_out, producer_err + consumer_err
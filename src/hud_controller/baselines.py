@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+from pathlib import Path
+
+import click
+
+from .go_modules import module_path, package_dir
+from .tasks import load_tasks
+from .utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# One character per outcome in a baseline's per-test codes ("<buggy><golden>").
+_CODES = {"pass": "p", "fail": "f", "skip": "s"}
+ABSENT = "-"
+
+
+def _split(key: str) -> tuple[str, str]:
+    # JUnitTally keys are "classname/name" and Go import paths contain
+    # slashes too, but test names start with "Test".
+    index = key.find("/Test")
+    return key[:index], key[index + 1 :]
+
+
+def build_baseline(buggy: dict[str, str], golden: dict[str, str], module: str | None) -> dict:
+    """
+    Per-test outcome codes from two runs' JUnitTally.outcomes.
+
+    Returns {"packages": {import path: {"dir", "tests": {name: code}}}},
+    where code is the buggy then the golden outcome ("p", "f", "s", or "-"
+    when the test did not report). Only Go test functions and their subtests
+    are kept, not the synthetic TestMain/Timeout cases.
+    """
+    packages: dict[str, dict] = {}
+    for key in sorted(set(buggy) | set(golden)):
+        if "/Test" not in key:
+            continue
+        pkg, name = _split(key)
+        if name == "TestMain" or name.startswith("TestMain/"):
+            continue
+        code = _CODES.get(buggy.get(key), ABSENT) + _CODES.get(golden.get(key), ABSENT)
+        entry = packages.setdefault(pkg, {"dir": package_dir(pkg, module), "tests": {}})
+        entry["tests"][name] = code
+    return {"packages": packages}
+
+
+def selection(baseline: dict) -> dict[str, dict[str, list[str]]]:
+    """
+    {"fail_to_pass": {import path: names}, "pass_to_pass": {...}}.
+
+    FAIL_TO_PASS tests pass at golden but failed or did not run at buggy;
+    PASS_TO_PASS tests pass at both. Tests that do not pass at golden are
+    not graded.
+    """
+    result: dict[str, dict[str, list[str]]] = {"fail_to_pass": {}, "pass_to_pass": {}}
+    for pkg, entry in baseline["packages"].items():
+        for name, code in sorted(entry["tests"].items()):
+            if code[1] != "p":
+                continue
+            kind = "pass_to_pass" if code[0] == "p" else "fail_to_pass"
+            result[kind].setdefault(pkg, []).append(name)
+    return result
+
+
+def score(baseline: dict, outcomes: dict[str, str]) -> dict:
+    """
+    Grade outcomes against the baseline: the fraction of FAIL_TO_PASS and
+    PASS_TO_PASS tests that passed, with per-kind counts and the tests that
+    did not pass. A test that did not report counts as failed.
+    """
+    result: dict = {}
+    passed = total = 0
+    for kind, packages in selection(baseline).items():
+        failed = [
+            f"{pkg}/{name}"
+            for pkg, names in packages.items()
+            for name in names
+            if outcomes.get(f"{pkg}/{name}") != "pass"
+        ]
+        count = sum(len(names) for names in packages.values())
+        result[kind] = {"passed": count - len(failed), "total": count, "failed": failed}
+        passed += count - len(failed)
+        total += count
+    result["score"] = passed / total if total else 0.0
+    return result
+
+
+class BaselineStore:
+    """Per-task golden baselines, one JSON file per task."""
+
+    def __init__(self, root: str | None = None):
+        self.root = Path(root or os.environ.get("BASELINE_DIR", "/evaluation/baselines"))
+
+    def _path(self, task: str) -> Path:
+        return self.root / f"{task.replace('/', '_')}.json"
+
+    def load(self, task: str, golden: str) -> dict | None:
+        """The task's baseline, if there is one for this golden commit."""
+        try:
+            with open(self._path(task)) as f:
+                baseline = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return baseline if baseline.get("golden") == golden else None
+
+    def save(self, task: str, baseline: dict):
+        atomic_write_json(self._path(task), baseline, separators=(",", ":"), sort_keys=True)
+
+
+def _run_at(task_id: str, task: dict, source: str) -> dict[str, str]:
+    """Set up REPO_PATH with source's code and the golden tests, grade it in full and return the outcomes."""
+    from .grading_runner import GradingRunner
+    from .setup import setup_codebase
+    from .test_manifest import paths_at, restore
+
+    golden = task["golden_commit"]
+    repo_path = os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+    secure_git = os.environ.get("SECURE_GIT_DIR", "/evaluation/secure_git/repo.git")
+    asyncio.run(setup_codebase(source, golden, golden))
+    # The task's own test files as of golden; baseline grading restores the
+    # same files into the agent's workspace before it runs.
+    test_files = paths_at(secure_git, golden, [path for path in task["files"] if path.endswith("_test.go")])
+    if source != golden and test_files:
+        restore(repo_path, secure_git, golden, test_files)
+    runner = GradingRunner(
+        base=source,
+        test=golden,
+        golden=golden,
+        test_files=task["files"],
+        config={"test_selection": "full"},
+        problem_id=task_id,
+    )
+    _score, metadata = runner.run_grading()
+    if metadata.get("error"):
+        raise RuntimeError(metadata["error"])
+    return runner.outcomes
+
+
+@click.command()
+@click.option("--task", "task_ids", multiple=True, help="Task id to compute (default: all tasks)")
+def main(task_ids: tuple[str, ...]):
+    """Run each task's tests at its buggy and golden commits and store the per-test baseline."""
+    logging.basicConfig(level=logging.INFO)
+    repo_path = os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+    store = BaselineStore()
+    tasks = load_tasks()
+    for task_id in task_ids or tasks:
+        task = tasks[task_id]
+        try:
+            buggy = _run_at(task_id, task, task["buggy_commit"])
+            golden = _run_at(task_id, task, task["golden_commit"])
+        except Exception as e:
+            logger.warning(f"Baseline failed for {task_id}: {e}")
+            continue
+        baseline = build_baseline(buggy, golden, module_path(repo_path))
+        baseline.update(task_id=task_id, buggy=task["buggy_commit"], golden=task["golden_commit"])
+        store.save(task_id, baseline)
+        chosen = selection(baseline)
+        counts = {kind: sum(len(names) for names in packages.values()) for kind, packages in chosen.items()}
+        logger.info(f"{task_id}: {counts['fail_to_pass']} FAIL_TO_PASS, {counts['pass_to_pass']} PASS_TO_PASS")
+    click.echo(f"Wrote baselines to {store.root}")
@@ -0,0 +1,104 @@
+import logging
+import os
+import threading
+import uuid
+from collections.abc import Iterator
+from contextlib import contextmanager
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+# Keys whose binaries a grading in this process is running, which eviction
+# skips; shared by every BinaryCache since each grading makes its own.
+_pins: dict[str, int] = {}
+_pins_lock = threading.Lock()
+
+
+class BinaryCache:
+    """
+    Root-only store of compiled test binaries (`go test -c`), one file per key.
+
+    Keys are content addresses of everything a binary is built from (see
+    GradingRunner._prepare_result_cache), so an entry never goes stale; the
+    least recently used binaries are evicted once the store exceeds
+    `max_bytes`, except those pinned by a running grading.
+    """
+
+    def __init__(self, root: str | None = None, max_bytes: int | None = None):
+        self.root = Path(root or os.environ.get("BINARY_CACHE_DIR", "/evaluation/binary_cache"))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("BINARY_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.test"
+
+    def get(self, key: str) -> Path | None:
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    @contextmanager
+    def pinned(self, key: str) -> Iterator[None]:
+        """Keep key's binary from being evicted while the caller uses it."""
+        with _pins_lock:
+            _pins[key] = _pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with _pins_lock:
+                _pins[key] -= 1
+                if not _pins[key]:
+                    del _pins[key]
+
+    def put(self, key: str, binary: Path) -> Path:
+        """Move a freshly built binary into the cache and return its cached path."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        os.chmod(self.root, 0o700)
+        path = self._path(key)
+        tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+        # The binary may live on another filesystem, so copy before the atomic rename.
+        try:
+            os.replace(binary, tmp)
+        except OSError:
+            with open(binary, "rb") as src, open(tmp, "wb") as dest:
+                while chunk := src.read(1024 * 1024):
+                    dest.write(chunk)
+            os.chmod(tmp, 0o755)
+            os.unlink(binary)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+        return path
+
+    def evict(self, keep: Path | None = None):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".test") and not entry.name.startswith("."):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        with _pins_lock:
+            pinned = {str(self._path(key)) for key in _pins}
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if (keep is not None and path == str(keep)) or path in pinned:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                continue
+            total -= size
+            logger.info(f"Evicted test binary {os.path.basename(path)[:17]} ({size} bytes)")
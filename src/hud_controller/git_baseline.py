@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+from pathlib import Path
+
+from . import async_proc
+
+logger = logging.getLogger(__name__)
+
+COMMIT_MESSAGE = "Initial state (contains bug to fix)"
+
+
+async def _git(args: list[str], env: dict[str, str] | None = None, cwd: str | None = None) -> str:
+    _, stdout, _ = await async_proc.run("git", *args, cwd=cwd, env=env)
+    return stdout.decode()
+
+
+async def build_baseline(tree: Path, dest: Path):
+    """
+    Precompute the agent's initial commit for a pristine tree.
+
+    Objects are written into a throwaway repository with no link to the secure
+    repo, so the resulting pack holds exactly one parentless commit plus the
+    trees and blobs of the snapshot. `dest` receives baseline.pack/.idx and a
+    baseline.json with the commit, tree and `git ls-files -s` index entries.
+    """
+    with tempfile.TemporaryDirectory(dir=dest.parent, prefix=".baseline-") as tmp:
+        git_dir = os.path.join(tmp, "repo.git")
+        await _git(["init", "--quiet", "--bare", git_dir])
+        env = {
+            **os.environ,
+            "GIT_DIR": git_dir,
+            "GIT_WORK_TREE": str(tree),
+            "GIT_INDEX_FILE": os.path.join(tmp, "index"),
+        }
+
+        await _git(["add", "-A", "."], env=env, cwd=str(tree))
+        tree_id = (await _git(["write-tree"], env=env)).strip()
+        commit_id = (await _git(["commit-tree", tree_id, "-m", COMMIT_MESSAGE], env=env)).strip()
+        entries = []
+        for line in (await _git(["ls-files", "-s", "-z"], env=env, cwd=str(tree))).split("\0"):
+            if not line:
+                continue
+            info, path = line.split("\t", 1)
+            mode, blob, _stage = info.split()
+            entries.append([int(mode, 8), blob, path])
+
+        await _git(["update-ref", "refs/heads/baseline", commit_id], env=env)
+        await _git(["repack", "-a", "-d", "-q"], env=env)
+
+        staging = Path(tmp) / "baseline"
+        staging.mkdir()
+        pack_dir = Path(git_dir) / "objects" / "pack"
+        (pack,) = pack_dir.glob("pack-*.pack")
+        shutil.move(pack, staging / "baseline.pack")
+        shutil.move(pack.with_suffix(".idx"), staging / "baseline.idx")
+        info = {"commit": commit_id, "tree": tree_id, "pack": pack.stem, "entries": entries}
+        with open(staging / "baseline.json", "w") as f:
+            json.dump(info, f)
+
+        try:
+            os.rename(staging, dest)
+        except OSError:
+            logger.info("Baseline already built concurrently")
+
+
+def write_index(repo_path: str, entries: list[list]):
+    """
+    Write a version 2 index for `entries` using the workspace's current stat data.
+
+    Equivalent to what `git add .` leaves behind, so `git status` sees a clean
+    tree without rehashing any file.
+    """
+    body = bytearray(b"DIRC" + struct.pack(">II", 2, len(entries)))
+    for mode, blob, path in entries:
+        st = os.lstat(os.path.join(repo_path, path))
+        name = os.fsencode(path)
+        entry = struct.pack(
+            ">10I",
+            int(st.st_ctime) & 0xFFFFFFFF,
+            st.st_ctime_ns % 1_000_000_000,
+            int(st.st_mtime) & 0xFFFFFFFF,
+            st.st_mtime_ns % 1_000_000_000,
+            st.st_dev & 0xFFFFFFFF,
+            st.st_ino & 0xFFFFFFFF,
+            mode,
+            st.st_uid,
+            st.st_gid,
+            st.st_size & 0xFFFFFFFF,
+        )
+        entry += bytes.fromhex(blob) + struct.pack(">H", min(len(name), 0xFFF)) + name
+        entry += b"\0" * (8 - len(entry) % 8)
+        body += entry
+    body += hashlib.sha1(body).digest()
+
+    index_path = os.path.join(repo_path, ".git", "index")
+    with open(index_path + ".tmp", "wb") as f:
+        f.write(body)
+    os.replace(index_path + ".tmp", index_path)
+
+
+async def install_baseline(repo_path: str, baseline: Path) -> int:
+    """
+    Give repo_path a fresh .git whose only commit is the precomputed baseline.
+
+    The pack is copied (never hardlinked, so an in-place write cannot reach the
+    cache) into .git/objects/pack, HEAD's branch is pointed at the baseline
+    commit, and the index is written from the stored entries. Must run after
+    the workspace files have their final ownership, since uid/gid/ctime are
+    recorded in the index. Returns the number of index entries.
+    """
+    with open(baseline / "baseline.json") as f:
+        info = json.load(f)
+
+    git_dir = os.path.join(repo_path, ".git")
+    await asyncio.to_thread(shutil.rmtree, git_dir, ignore_errors=True)
+    await _git(["init"], cwd=repo_path)
+
+    pack_dir = os.path.join(git_dir, "objects", "pack")
+    for suffix in ("pack", "idx"):
+        src = baseline / f"baseline.{suffix}"
+        dest = os.path.join(pack_dir, f"{info['pack']}.{suffix}")
+        await async_proc.run("cp", "--reflink=auto", str(src), dest)
+        os.chmod(dest, 0o444)
+
+    await _git(
+        ["update-ref", "-m", f"commit (initial): {COMMIT_MESSAGE}", "HEAD", info["commit"]],
+        cwd=repo_path,
+    )
+    await asyncio.to_thread(write_index, repo_path, info["entries"])
+    return len(info["entries"])
@@ -0,0 +1,117 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import subprocess
+import threading
+import time
+
+import click
+
+from .grading_runner import target_packages
+from .tasks import load_tasks, task_files
+from .workspace import as_agent
+
+logger = logging.getLogger(__name__)
+
+# Lines of `go test -x` output that invoke the compiler for one package.
+COMPILE_RE = re.compile(r"/compile\s.*\s-p\s")
+
+_history_lock = threading.Lock()
+_history: list[dict] = []
+
+
+def prewarm(repo_path: str, packages: list[str]) -> dict:
+    """
+    Compile `packages` and their test dependencies into GOCACHE without running tests.
+
+    Uses the same build flags as grading (-mod=vendor via GOFLAGS, -short is a
+    test flag and does not affect cache keys) so the grading compile hits the
+    cache. Runs as the agent user so GOCACHE stays writable for the agent.
+    The hit ratio counts packages that were already cached.
+    """
+    start = time.time()
+    listed = subprocess.run(
+        ["go", "list", "-deps", "-test", "-f", "{{.ImportPath}}", *packages],
+        cwd=repo_path,
+        capture_output=True,
+        text=True,
+        **as_agent(),
+    )
+    total = len({line for line in listed.stdout.splitlines() if line})
+
+    proc = subprocess.Popen(
+        ["go", "test", "-x", "-short", "-run", "^$", *packages],
+        cwd=repo_path,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+        **as_agent(),
+    )
+    compiled = sum(1 for line in proc.stderr if COMPILE_RE.search(line))
+    proc.wait()
+
+    result = {
+        "packages": packages,
+        "deps_total": total,
+        "compiled": compiled,
+        "hit_ratio": max(0.0, 1.0 - compiled / total) if total else 0.0,
+        "returncode": proc.returncode,
+        "duration": time.time() - start,
+    }
+    logger.info(
+        f"Go cache prewarm: {compiled} of {total} packages compiled "
+        f"(hit ratio {result['hit_ratio']:.2f}) in {result['duration']:.1f}s"
+    )
+    return result
+
+
+def _prewarm_task(repo_path: str, problem_id: str):
+    try:
+        result = prewarm(repo_path, target_packages(task_files(problem_id), repo_path))
+    except Exception as e:
+        logger.warning(f"Go cache prewarm failed for {problem_id}: {e}")
+        return
+    result["problem_id"] = problem_id
+    with _history_lock:
+        _history.append(result)
+
+
+def prewarm_in_background(problem_id: str, repo_path: str | None = None) -> threading.Thread | None:
+    """Prewarm GOCACHE for a freshly set-up task when GO_PREWARM=lazy."""
+    if os.environ.get("GO_PREWARM", "off") != "lazy":
+        return None
+    repo_path = repo_path or os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+    thread = threading.Thread(
+        target=_prewarm_task, args=(repo_path, problem_id), name="go-prewarm", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def prewarm_stats() -> dict:
+    with _history_lock:
+        runs = list(_history)
+    compiled = sum(r["compiled"] for r in runs)
+    total = sum(r["deps_total"] for r in runs)
+    return {
+        "runs": runs,
+        "overall_hit_ratio": max(0.0, 1.0 - compiled / total) if total else 0.0,
+    }
+
+
+@click.command()
+@click.option("--task", "task_ids", multiple=True, help="Task id to prewarm (default: all tasks)")
+def main(task_ids: tuple[str, ...]):
+    """Set up each task's base commit in REPO_PATH and compile it into GOCACHE."""
+    from .setup import setup_codebase
+
+    logging.basicConfig(level=logging.INFO)
+    repo_path = os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+    tasks = load_tasks()
+    for task_id in task_ids or tasks:
+        task = tasks[task_id]
+        asyncio.run(setup_codebase(task["buggy_commit"], task["golden_commit"], task["golden_commit"]))
+        _prewarm_task(repo_path, task_id)
+    click.echo(json.dumps(prewarm_stats(), indent=2))
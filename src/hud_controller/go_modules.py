@@ -0,0 +1,180 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from pathlib import Path
+
+from .tree_cache import walk_files
+from .utils import atomic_write_json
+from .workspace import stat_key
+
+logger = logging.getLogger(__name__)
+
+_IMPORT_LINE = re.compile(r'^\s*(?:[\w.]+\s+)?"([^"]+)"')
+_DECL = re.compile(r"^(?:func|type|var|const)\b")
+
+
+def module_path(repo_path: str) -> str | None:
+    """The module path declared in repo_path/go.mod."""
+    try:
+        with open(os.path.join(repo_path, "go.mod")) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) >= 2 and fields[0] == "module":
+                    return fields[1].strip('"')
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def package_dir(import_path: str, module: str | None) -> str | None:
+    """Relative package pattern ("./dir" or ".") for an import path inside the module."""
+    if module is None:
+        return None
+    if import_path == module:
+        return "."
+    if import_path.startswith(module + "/"):
+        return "./" + import_path[len(module) + 1 :]
+    return None
+
+
+def _file_imports(path: str) -> list[str] | None:
+    """Import paths of one Go file, or None if `//go:build ignore` excludes it."""
+    imports = []
+    in_block = False
+    with open(path, errors="replace") as f:
+        for line in f:
+            stripped = line.strip()
+            if stripped.startswith("//go:build") and stripped.split()[1:] == ["ignore"]:
+                return None
+            if in_block:
+                if stripped.startswith(")"):
+                    in_block = False
+                    continue
+                match = _IMPORT_LINE.match(stripped)
+                if match:
+                    imports.append(match.group(1))
+            elif stripped.startswith("import"):
+                rest = stripped[len("import"):].strip()
+                if rest.startswith("("):
+                    in_block = True
+                else:
+                    match = _IMPORT_LINE.match(rest)
+                    if match:
+                        imports.append(match.group(1))
+            elif _DECL.match(line):
+                # Imports must precede all declarations.
+                break
+    return imports
+
+
+def module_imports(repo_path: str) -> set[str]:
+    """
+    Union of the imports of every Go file `go mod tidy` would look at.
+
+    Skips vendor/, nested modules and the directories the go command ignores
+    (testdata, and names starting with "." or "_"). Build constraints other
+    than `ignore` are not evaluated, since tidy considers all of them.
+    """
+    imports = set()
+    for dirpath, dirnames, filenames in os.walk(repo_path):
+        top = dirpath == repo_path
+        dirnames[:] = [
+            d for d in dirnames
+            if not (d.startswith((".", "_")) or d == "testdata" or (top and d == "vendor"))
+            and not os.path.exists(os.path.join(dirpath, d, "go.mod"))
+        ]
+        for name in filenames:
+            if name.endswith(".go"):
+                file_imports = _file_imports(os.path.join(dirpath, name))
+                if file_imports:
+                    imports.update(file_imports)
+    return imports
+
+
+def _file_digest(path: str) -> str | None:
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def fingerprint(repo_path: str) -> dict[str, str | None]:
+    """
+    Digests of the inputs to `go mod tidy` / `go mod vendor` and of vendor/ itself.
+
+    vendor/ is fingerprinted by stat (including ctime, which cannot be set
+    back), so any edit to a vendored file shows up without hashing it.
+    """
+    imports = hashlib.sha1("\n".join(sorted(module_imports(repo_path))).encode()).hexdigest()
+    vendor = hashlib.sha1()
+    for rel, st in sorted(walk_files(os.path.join(repo_path, "vendor"))):
+        vendor.update(f"{rel}\0{stat_key(st)}\n".encode())
+    return {
+        "go_mod": _file_digest(os.path.join(repo_path, "go.mod")),
+        "go_sum": _file_digest(os.path.join(repo_path, "go.sum")),
+        "imports": imports,
+        "vendor": vendor.hexdigest(),
+    }
+
+
+def inputs_match(recorded: dict | None, current: dict) -> bool:
+    """True if go.mod, go.sum and the import set are as recorded."""
+    if not recorded:
+        return False
+    return all(recorded.get(k) == current[k] for k in ("go_mod", "go_sum", "imports"))
+
+
+class FingerprintStore:
+    """
+    Each workspace's module fingerprint as of its last
+    known-consistent state: the last successful tidy/vendor at grading.
+    """
+
+    def __init__(self, root: str | None = None):
+        self.root = Path(root or os.environ.get("MODULE_STATE_DIR", "/evaluation/module_state"))
+
+    def _path(self, repo_path: str) -> Path:
+        digest = hashlib.sha1(os.path.realpath(repo_path).encode()).hexdigest()[:16]
+        return self.root / f"{digest}.json"
+
+    def load(self, repo_path: str) -> dict | None:
+        try:
+            with open(self._path(repo_path)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, repo_path: str, record: dict):
+        self._save_json(self._path(repo_path).name, record)
+
+    def move(self, src: str, dest: str):
+        """Re-home a record after the workspace directory was renamed."""
+        record = self.load(src)
+        self.clear(src)
+        if record is None:
+            self.clear(dest)
+        else:
+            self.save(dest, record)
+
+    def clear(self, repo_path: str):
+        try:
+            self._path(repo_path).unlink()
+        except FileNotFoundError:
+            pass
+
+    def full_update_seconds(self) -> float | None:
+        """Duration of the last tidy + vendor run in any workspace (they share one module)."""
+        try:
+            with open(self.root / "timing.json") as f:
+                return json.load(f).get("tidy_vendor_seconds")
+        except (OSError, ValueError):
+            return None
+
+    def record_full_update(self, seconds: float):
+        self._save_json("timing.json", {"tidy_vendor_seconds": seconds})
+
+    def _save_json(self, name: str, data: dict):
+        atomic_write_json(self.root / name, data)
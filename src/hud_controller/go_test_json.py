@@ -0,0 +1,256 @@
+import json
+import logging
+import re
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# Characters XML 1.0 cannot carry, e.g. terminal escapes in test output.
+_INVALID_XML = re.compile("[^\x09\x0a\x0d\x20-\ud7ff\ue000-\ufffd\U00010000-\U0010ffff]")
+
+_BUILD_FAILED = re.compile(r"^FAIL\s+(\S+)\s+\[(?:build|setup) failed\]")
+
+# "file.go:line:col: message" from the compiler, or vet's "vet: file.go:line:col: message".
+_DIAGNOSTIC = re.compile(r"^(?:vet: )?(?P<file>[^\s:][^:]*\.go):(?P<line>\d+)(?::(?P<column>\d+))?: (?P<message>.*)$")
+
+# Per-element cap on captured output, matching the gotestsum fallback XML.
+MAX_OUTPUT_CHARS = 5000
+# Lines of output held per test or package; older ones are dropped, since
+# only the tail (MAX_OUTPUT_CHARS) ever makes it into the XML.
+MAX_OUTPUT_LINES = 500
+
+
+@dataclass
+class TestResult:
+    name: str
+    status: str = "run"
+    elapsed: float = 0.0
+    output: list[str] = field(default_factory=list)
+    timed_out: bool = False
+
+
+@dataclass
+class PackageResult:
+    name: str
+    status: str = "run"
+    elapsed: float = 0.0
+    output: list[str] = field(default_factory=list)
+    tests: dict[str, TestResult] = field(default_factory=dict)
+    timed_out: bool = False
+    build_failed: bool = False
+
+    @property
+    def failed_tests(self) -> list[TestResult]:
+        return [t for t in self.tests.values() if t.status == "fail"]
+
+
+def _append(lines: list[str], text: str):
+    lines.append(text)
+    if len(lines) > MAX_OUTPUT_LINES:
+        del lines[: len(lines) - MAX_OUTPUT_LINES // 2]
+
+
+def _clip(lines: list[str]) -> str:
+    text = "".join(lines)
+    if len(text) > MAX_OUTPUT_CHARS:
+        text = text[-MAX_OUTPUT_CHARS:]
+    return _INVALID_XML.sub("", text)
+
+
+class Test2JSONStream:
+    """
+    Incremental parser for the event stream of `go test -json`.
+
+    Feed it lines as they arrive; `feed` returns the PackageResult whenever a
+    package finishes so callers can report progress. Lines that are not JSON
+    (compiler errors on stderr, for instance) are kept as stray output and
+    attached to packages that failed without a failing test.
+    """
+
+    def __init__(self):
+        self.packages: dict[str, PackageResult] = {}
+        self.stray: list[str] = []
+        # Go 1.24+ reports build errors as build-output events keyed by ImportPath.
+        self.build_output: dict[str, list[str]] = {}
+        self._build_header: str | None = None
+
+    def _package(self, name: str) -> PackageResult:
+        package = self.packages.get(name)
+        if package is None:
+            package = self.packages[name] = PackageResult(name)
+        return package
+
+    def feed(self, line: str) -> PackageResult | None:
+        line = line.rstrip("\n")
+        if not line:
+            return None
+        try:
+            event = json.loads(line)
+        except ValueError:
+            event = None
+        if not isinstance(event, dict):
+            return self._feed_text(line)
+
+        action = event.get("Action")
+        name = event.get("Package")
+        if not name:
+            import_path = event.get("ImportPath", "").split(" ")[0]
+            if action == "build-output" and import_path:
+                _append(self.build_output.setdefault(import_path, []), event.get("Output", ""))
+            return None
+
+        package = self._package(name)
+        test_name = event.get("Test")
+        if test_name:
+            test = package.tests.get(test_name)
+            if test is None:
+                test = package.tests[test_name] = TestResult(test_name)
+            if action == "output":
+                _append(test.output, event.get("Output", ""))
+            elif action in ("pass", "fail", "skip"):
+                test.status = action
+                test.elapsed = event.get("Elapsed", 0.0)
+                if action == "pass":
+                    # Passing tests carry no output in the XML.
+                    test.output.clear()
+            return None
+
+        if action == "output":
+            _append(package.output, event.get("Output", ""))
+        elif action in ("pass", "fail", "skip"):
+            package.status = action
+            package.elapsed = event.get("Elapsed", 0.0)
+            if event.get("FailedBuild"):
+                package.build_failed = True
+            if action == "fail":
+                # A panic or timeout ends the binary with tests still running.
+                for test in package.tests.values():
+                    if test.status == "run":
+                        test.status = "fail"
+            return package
+        return None
+
+    def _feed_text(self, line: str) -> PackageResult | None:
+        # Before Go 1.24, build errors bypass test2json: the compiler output
+        # follows a "# pkg [pkg.test]" header and the package ends with a
+        # plain "FAIL pkg [build failed]" line instead of a fail event.
+        _append(self.stray, line + "\n")
+        if line.startswith("# "):
+            self._build_header = line[2:].split(" ")[0]
+            return None
+        match = _BUILD_FAILED.match(line)
+        if match:
+            self._build_header = None
+            package = self._package(match.group(1))
+            package.status = "fail"
+            package.build_failed = True
+            package.output.append(line + "\n")
+            return package
+        if self._build_header:
+            _append(self.build_output.setdefault(self._build_header, []), line + "\n")
+        return None
+
+    def finish(self, timed_out: bool = False):
+        """
+        Mark packages the stream never concluded (the go command died) as
+        failed, and as timed out if the caller killed it for running too long.
+        """
+        for package in self.packages.values():
+            if package.status == "run":
+                package.status = "fail"
+                package.timed_out = timed_out
+                for test in package.tests.values():
+                    if test.status == "run":
+                        test.status = "fail"
+                        test.timed_out = timed_out
+
+    def merge(self, other: "Test2JSONStream"):
+        """
+        Fold in the results of another stream, e.g. one -run shard of the
+        same package. A package fails if it failed in any stream and runs as
+        long as its slowest stream.
+        """
+        for name, theirs in other.packages.items():
+            ours = self.packages.get(name)
+            if ours is None:
+                self.packages[name] = theirs
+                continue
+            ours.tests.update(theirs.tests)
+            ours.output.extend(theirs.output)
+            ours.elapsed = max(ours.elapsed, theirs.elapsed)
+            ours.timed_out = ours.timed_out or theirs.timed_out
+            ours.build_failed = ours.build_failed or theirs.build_failed
+            statuses = {ours.status, theirs.status}
+            for status in ("fail", "run", "pass", "skip"):
+                if status in statuses:
+                    ours.status = status
+                    break
+        self.stray.extend(other.stray)
+        for name, lines in other.build_output.items():
+            self.build_output.setdefault(name, []).extend(lines)
+
+    def diagnostics(self) -> list[dict]:
+        """
+        Compiler and vet errors as {"package", "file", "line", "column", "message"}.
+
+        "package" is the package being built when the error was reported,
+        which for a broken dependency is not the package under test.
+        """
+        diagnostics = []
+        for name, lines in sorted(self.build_output.items()):
+            for line in lines:
+                match = _DIAGNOSTIC.match(line.rstrip("\n"))
+                if match:
+                    diagnostics.append({
+                        "package": name,
+                        "file": match.group("file"),
+                        "line": int(match.group("line")),
+                        "column": int(match.group("column") or 0),
+                        "message": match.group("message"),
+                    })
+        return diagnostics
+
+    def _package_failure_output(self, package: PackageResult) -> str:
+        build_output = self.build_output.get(package.name)
+        return _clip(package.output + (build_output if build_output is not None else self.stray))
+
+    def junit_suites(self) -> list[tuple[str, str]]:
+        """(import path, <testsuite> element) per package, sorted by import path."""
+        suites = []
+        for name in sorted(self.packages):
+            package = self.packages[name]
+            suite = ET.Element("testsuite", name=name)
+            failures = skipped = 0
+            for test in package.tests.values():
+                case = ET.SubElement(
+                    suite, "testcase", classname=name, name=test.name, time=f"{test.elapsed:.3f}"
+                )
+                if test.status == "fail":
+                    failures += 1
+                    message = "Timeout" if test.timed_out else "Failed"
+                    ET.SubElement(case, "failure", message=message, type="").text = _clip(test.output)
+                elif test.status == "skip":
+                    skipped += 1
+                    ET.SubElement(case, "skipped", message=_clip(test.output).strip()[:200])
+            if package.timed_out and not any(t.timed_out for t in package.tests.values()):
+                # Killed outside any test, e.g. in TestMain or between tests.
+                failures += 1
+                case = ET.SubElement(suite, "testcase", classname=name, name="Timeout", time="0.000")
+                ET.SubElement(case, "failure", message="Timeout", type="").text = (
+                    "Test package timed out\n" + _clip(package.output)
+                )
+            elif package.status == "fail" and not failures:
+                # Build failure, TestMain exit or crash outside any test.
+                failures += 1
+                case = ET.SubElement(suite, "testcase", classname=name, name="TestMain", time="0.000")
+                ET.SubElement(case, "failure", message="Build/Execution Failure", type="").text = (
+                    self._package_failure_output(package)
+                )
+            suite.set("tests", str(len(suite)))
+            suite.set("failures", str(failures))
+            suite.set("errors", "0")
+            suite.set("skipped", str(skipped))
+            suite.set("time", f"{package.elapsed:.3f}")
+            suites.append((name, ET.tostring(suite, encoding="unicode")))
+        return suites
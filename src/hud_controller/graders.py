@@ -54,6 +54,8 @@ class AgentPatchGrader(Grader):
             mocha_test_files=mocha_test_files,
             test_files=actual_files_to_run,
             only_server=ONLY_SERVER,
+            config=state.config,
+            problem_id=state.problem_id,
         )
 
         score, metadata = runner.run_grading()
@@ -185,15 +185,211 @@
 
 #!/usr/bin/env python3
 
+import contextlib
+import fcntl
+import hashlib
+import json
 import logging
 import os
+import re
+import resource
+import shutil
 import subprocess
+import tempfile
+import threading
+import uuid
 import xml.etree.ElementTree as ET
 from pathlib import Path
+from typing import Iterator
 import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .async_proc import kill_group
+
+from .baselines import BaselineStore, score as baseline_score, selection
+from .binary_cache import BinaryCache
+from .go_modules import FingerprintStore, fingerprint, inputs_match, module_path
+from .go_test_json import Test2JSONStream
+from .impact import impact_targets
+from .package_history import MemoryGate, PackageHistory, estimates, lpt_order
+from .result_cache import ResultCache, package_keys, pattern_packages, workspace_digests
+from .test_focus import focus_for, run_filter
+from .test_manifest import enforce, paths_at, restore
+from .utils import JUnitTally, available_cpus, available_memory
 
 logger = logging.getLogger(__name__)
 
+# go test flags per grading engine; part of the result cache key.
+GOTESTSUM_FLAGS = ["-mod=vendor", "-short", "-v", "-json"]
+JSON_FLAGS = ["-mod=vendor", "-short", "-json"]
+# Builds (and vets) each package's tests, then runs no test at all.
+PRECHECK_FLAGS = ["-mod=vendor", "-short", "-run=^$", "-json"]
+
+# Compile diagnostics kept in the grade metadata.
+MAX_DIAGNOSTICS = 100
+
+# Characters of a JUnit report file read at a time while merging it.
+XML_CHUNK_CHARS = 65536
+# Characters of each package's stdout/stderr kept in memory; the rest is only in the artifact files.
+OUTPUT_TAIL_CHARS = 5000
+DEFAULT_ARTIFACTS_KEEP = 20
+# Held by a grading for as long as it writes to its artifacts directory.
+ARTIFACTS_LOCK = ".lock"
+
+DEFAULT_DEADLINE_SECONDS = 3600
+DEFAULT_PACKAGE_TIMEOUT_SECONDS = 300
+
+# Test binaries run directly (see _run_binary) are built with the build flags of
+# GOTESTSUM_FLAGS and run with its test flags; the timeout is added per run.
+BINARY_BUILD_FLAGS = ["-mod=vendor"]
+BINARY_TEST_FLAGS = ["-test.short"]
+DEFAULT_SHARD_MIN_TESTS = 50
+# Expected compile+run seconds from which a package runs as a test binary.
+DEFAULT_BINARY_MIN_SECONDS = 30
+
+def grading_workers(package_count: int) -> int:
+    """Concurrent packages for grading: GRADING_WORKERS, else the usable CPU count."""
+    workers = int(os.environ.get("GRADING_WORKERS", 0)) or available_cpus()
+    return max(1, min(workers, package_count))
+
+def grading_shards(active_workers: int = 1) -> int:
+    """
+    -run shards per large package: GRADING_SHARDS (1 turns sharding off),
+    else the usable CPUs left to each of the active_workers packages running.
+    """
+    configured = int(os.environ.get("GRADING_SHARDS", 0))
+    if configured:
+        return max(1, configured)
+    return max(1, available_cpus() // max(1, active_workers))
+
+def split_shards(names: list[str], shards: int) -> list[list[str]]:
+    """Deal test names round-robin into at most `shards` non-empty shards."""
+    if not names:
+        return []
+    shards = max(1, min(shards, len(names)))
+    return [names[i::shards] for i in range(shards)]
+
+def _tail(path: Path, limit: int = OUTPUT_TAIL_CHARS) -> str:
+    """Last `limit` characters of a text file."""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - limit * 4))
+        return f.read().decode(errors="replace")[-limit:]
+
+def _wait_rusage(proc: subprocess.Popen, timeout: float | None) -> resource.struct_rusage:
+    """
+    Popen.wait that reaps with wait4 to get the child's resource usage, which
+    includes every descendant it reaped. Raises TimeoutExpired like wait.
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    delay = 0.01
+    while True:
+        pid, status, usage = os.wait4(proc.pid, os.WNOHANG)
+        if pid:
+            proc.returncode = os.waitstatus_to_exitcode(status)
+            return usage
+        if deadline is not None and time.time() >= deadline:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        time.sleep(delay)
+        delay = min(delay * 2, 0.2)
+
+def _run_bounded(cmd: list[str], cwd: str, out_path: Path, err_path: Path, timeout: float | None) -> tuple[subprocess.Popen, resource.struct_rusage | None]:
+    """
+    Run cmd in its own process group with output to files, killing the group
+    after timeout seconds; the rusage is None if it was killed.
+    """
+    with open(out_path, "w") as out, open(err_path, "w") as err:
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=out, stderr=err, start_new_session=True)
+        try:
+            return proc, _wait_rusage(proc, timeout)
+        except subprocess.TimeoutExpired:
+            kill_group(proc)
+            proc.wait()
+            return proc, None
+
+def _package_elapsed(events_path: Path) -> float:
+    """Seconds test binaries ran, summed over the package-level results in a go test -json log."""
+    elapsed = 0.0
+    try:
+        with open(events_path, errors="replace") as f:
+            for line in f:
+                if '"Test":' in line or '"Elapsed":' not in line:
+                    continue
+                try:
+                    elapsed += json.loads(line).get("Elapsed", 0.0)
+                except ValueError:
+                    continue
+    except FileNotFoundError:
+        pass
+    return elapsed
+
+def _in_use(path: Path) -> bool:
+    """Whether a grading still holds the artifacts directory's lock."""
+    try:
+        fd = os.open(path / ARTIFACTS_LOCK, os.O_RDONLY | os.O_NOFOLLOW)
+    except OSError:
+        # Predates the lock, or not a directory of ours.
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    finally:
+        os.close(fd)
+    return False
+
+@contextlib.contextmanager
+def open_artifacts(label: str) -> Iterator[Path]:
+    """
+    A fresh root-only directory for one grading's output files.
+
+    Lives under GRADING_ARTIFACTS_DIR (default /evaluation/grading_artifacts),
+    which keeps the newest GRADING_ARTIFACTS_KEEP gradings; falls back to a
+    temporary directory if that is not writable. The directory stays locked
+    until the block exits, so a concurrent grading never prunes it while it
+    is still being written to.
+    """
+    root = Path(os.environ.get("GRADING_ARTIFACTS_DIR", "/evaluation/grading_artifacts"))
+    keep = int(os.environ.get("GRADING_ARTIFACTS_KEEP", DEFAULT_ARTIFACTS_KEEP))
+    try:
+        root.mkdir(parents=True, exist_ok=True)
+        os.chmod(root, 0o700)
+        # Serializes pruning with creating (and locking) the new directory.
+        with open(root / ARTIFACTS_LOCK, "w") as root_lock:
+            fcntl.flock(root_lock, fcntl.LOCK_EX)
+            previous = sorted(
+                (p for p in root.iterdir() if not p.name.startswith(".")), key=lambda p: p.stat().st_mtime
+            )
+            for old in previous[: max(0, len(previous) - keep + 1)]:
+                if _in_use(old):
+                    logger.info(f"Keeping {old.name}, a grading is still using it")
+                    continue
+                shutil.rmtree(old, ignore_errors=True)
+            path = root / f"{time.strftime('%Y%m%d-%H%M%S')}-{label}-{uuid.uuid4().hex[:6]}"
+            path.mkdir()
+            lock = open(path / ARTIFACTS_LOCK, "w")
+            fcntl.flock(lock, fcntl.LOCK_EX)
+    except OSError as e:
+        logger.warning(f"Cannot use {root} for grading artifacts ({e}), using a temporary directory")
+        lock, path = contextlib.nullcontext(), Path(tempfile.mkdtemp(prefix="grading-"))
+    with lock:
+        yield path
+
+def target_packages(test_files: list[str], repo_path: str) -> list[str]:
+    """Go packages to test for a task's file list."""
+    if not test_files: return ["./..."]
+    packages = set()
+    for filepath in test_files:
+        if filepath.endswith('.go'):
+            directory = os.path.dirname(filepath)
+            if directory: packages.add(f"./{directory}")
+            else: packages.add(".")
+    
+    if os.path.exists(os.path.join(repo_path, "test")):
+         packages.add("./test/...")
+
+    return sorted(list(packages))
+
 class GradingRunner:
     """Handles the grading workflow for Tekton (Go) tasks."""
 
@@ -208,6 +404,8 @@ class GradingRunner:
         only_server: bool = False,
         playwright_test_files: list[str] | None = None,
         mocha_test_files: list[str] | None = None,
+        config: dict | None = None,
+        problem_id: str | None = None,
     ):
         self.use_base = base
         self.use_test = test
@@ -219,6 +417,48 @@ class GradingRunner:
         self.repo_path = os.environ.get("REPO_PATH", "/home/ubuntu/repo")
         self.build_dir = Path(self.repo_path) 
         self.secure_git = os.environ.get("SECURE_GIT_DIR", "/evaluation/secure_git/repo.git")
+        # Extra grade metadata collected while grading, returned by run_grading.
+        self.metadata: dict = {}
+        self._tally = JUnitTally()
+        self._result_cache: ResultCache | None = None
+        self._result_keys: dict[str, str] = {}
+        self._binary_cache: BinaryCache | None = None
+        self._binary_keys: dict[str, str] = {}
+
+        # Task config (ProblemSpec.config) overrides the environment defaults.
+        config = config or {}
+        self.deadline_seconds = float(
+            config.get("grading_deadline_seconds", os.environ.get("GRADING_DEADLINE_SECONDS", DEFAULT_DEADLINE_SECONDS))
+        )
+        self.package_timeout_seconds = float(
+            config.get(
+                "package_timeout_seconds",
+                os.environ.get("PACKAGE_TIMEOUT_SECONDS", DEFAULT_PACKAGE_TIMEOUT_SECONDS),
+            )
+        )
+        self._deadline: float | None = None
+        self._timeouts: list[str] = []
+
+        # "focused" runs only the tests declared in the task's test files at
+        # the golden commit; "baseline" runs the task's FAIL_TO_PASS and
+        # PASS_TO_PASS tests and scores against its baseline; "full" runs
+        # whole packages.
+        self.problem_id = problem_id
+        self.test_selection = config.get("test_selection", os.environ.get("GRADING_TEST_SELECTION", "full"))
+        self._run_filters: dict[str, str] = {}
+        self._package_filters: dict[str, str] = {}
+        self._focus: dict[str, list[str]] = {}
+        self._baseline: dict | None = None
+        # Full test output goes to files here rather than into memory or the log.
+        self.artifacts: Path | None = None
+        # Scheduling state for the gotestsum engine (see _schedule).
+        self._history = PackageHistory()
+        self._estimates: dict[str, dict] = {}
+        self._measurements: dict[str, dict] = {}
+        self._gate: MemoryGate | None = None
+        # Packages running right now, so sharding only uses idle CPUs.
+        self._active = 0
+        self._active_lock = threading.Lock()
 
     def _format_junit_xml(self, test_name: str, message: str, stdout: str, stderr: str) -> str:
         """Generate JUnit XML for error cases."""
@@ -240,8 +480,26 @@ class GradingRunner:
 </testsuites>"""
 
     def _reset_test_files(self):
+        """
+        Anti-cheat: make test/ match the base commit with golden's test/ over it.
+
+        The workspace is checked against that composed tree's test/ manifest
+        and only what differs is restored (see test_manifest.enforce); what
+        was reset lands in self.metadata["test_integrity"]. Without a
+        manifest, test/ is re-extracted from the secure repository as a whole.
+        """
         if not self.use_golden: return
-        logger.info("Anti-cheat: Resetting test files...")
+        logger.info("Anti-cheat: Checking test files...")
+        report = enforce(self.repo_path, self.secure_git, self.use_golden, self.use_base)
+        if report is not None:
+            self.metadata["test_integrity"] = report
+            logger.info(
+                f"Test files checked against the golden manifest ({report['checked']} files): "
+                f"{len(report['missing'])} missing and {len(report['modified'])} modified restored, "
+                f"{len(report['added'])} added {'removed' if report['added_removed'] else 'kept'}"
+            )
+            return
+        self.metadata["test_integrity"] = {"manifest": None}
         try:
             cmd = f"git --git-dir={self.secure_git} archive {self.use_golden} -- test/ | tar -x -C {self.repo_path}"
             subprocess.run(cmd, shell=True, check=True, capture_output=True)
@@ -249,142 +507,976 @@ class GradingRunner:
         except subprocess.CalledProcessError:
             pass
 
+    def _run_filter(self, target: str) -> str | None:
+        """The focused -run regex for a target pattern or import path, if any."""
+        return self._run_filters.get(target) or self._package_filters.get(target)
+
+    def _restore_task_tests(self) -> list[str]:
+        """
+        Put the golden commit's version of the task's _test.go files in the
+        workspace, as the test patch would, so the tests selected from them
+        are the tests that run. Returns the restored paths.
+        """
+        listed = [path for path in self.test_files if path.endswith("_test.go")]
+        paths = paths_at(self.secure_git, self.use_golden, listed)
+        if paths:
+            restore(self.repo_path, self.secure_git, self.use_golden, paths)
+            logger.info(f"Restored {len(paths)} task test files from the golden commit")
+        return paths
+
+    def _focused_packages(self) -> list[str] | None:
+        """
+        Packages with focused tests, filling self._run_filters and
+        self._focus; None if the task has none.
+
+        ./test/... is still graded in full, as in "files" mode, unless a
+        focused package lives under test/.
+        """
+        focus, source = focus_for(self.problem_id, self.use_golden, self.test_files, self.secure_git)
+        self.metadata["focus"] = {"mode": "focused" if focus else "full", "source": source}
+        if not focus:
+            logger.info("No test functions found in the task's test files, grading whole packages")
+            return None
+        self.metadata["focus"]["restored"] = len(self._restore_task_tests())
+        self._focus = focus
+        self._run_filters = {pkg: run_filter(names) for pkg, names in focus.items()}
+        self.metadata["focus"]["tests"] = focus
+        logger.info(f"Focused grading: {sum(len(n) for n in focus.values())} tests in {len(focus)} packages")
+        packages = sorted(focus)
+        if os.path.exists(os.path.join(self.repo_path, "test")) and not any(
+            pkg == "./test" or pkg.startswith("./test/") for pkg in focus
+        ):
+            packages.append("./test/...")
+        return packages
+
+    def _import_path(self, pattern: str) -> str | None:
+        """Import path of a "./dir" or "." package pattern, from the module path in go.mod."""
+        module = module_path(self.repo_path)
+        if module is None:
+            return None
+        return module if pattern == "." else f"{module}/{pattern.removeprefix('./')}"
+
+    def _add_missing_focus(self):
+        """
+        Fail every focused test that reported no result, e.g. because the
+        agent renamed or deleted it and the -run filter matched nothing.
+        """
+        missing = {}
+        for pattern, names in sorted(self._focus.items()):
+            pkg = self._import_path(pattern) or pattern
+            absent = [name for name in names if f"{pkg}/{name}" not in self._tally.outcomes]
+            if not absent:
+                continue
+            missing[pkg] = absent
+            suite = ET.Element(
+                "testsuite", name=pkg, tests=str(len(absent)), failures=str(len(absent)),
+                errors="0", skipped="0", time="0.000",
+            )
+            for name in absent:
+                case = ET.SubElement(suite, "testcase", classname=pkg, name=name, time="0.000")
+                ET.SubElement(case, "failure", message="No result", type="").text = "Focused test did not run"
+            self._add_fragment(pkg, ET.tostring(suite, encoding="unicode"), "", "")
+        self.metadata["focus"]["missing"] = missing
+        if missing:
+            logger.warning(f"{sum(len(n) for n in missing.values())} focused tests reported no result, counted as failed")
+
+    @property
+    def outcomes(self) -> dict[str, str]:
+        """Outcome of every test of the last run, keyed by "classname/name"."""
+        return self._tally.outcomes
+
+    def _baseline_packages(self) -> list[str] | None:
+        """
+        Packages with FAIL_TO_PASS or PASS_TO_PASS tests, filling
+        self._run_filters; None if the task has no usable baseline.
+        """
+        baseline = BaselineStore().load(self.problem_id or "", self.use_golden)
+        if baseline is None:
+            logger.info("No baseline for this task's golden commit, grading whole packages")
+            self.metadata["baseline"] = {"used": False}
+            return None
+        graded: dict[str, set[str]] = {}
+        for packages in selection(baseline).values():
+            for pkg, names in packages.items():
+                target = baseline["packages"][pkg]["dir"]
+                if target is None:
+                    continue
+                graded.setdefault(target, set()).update(name.split("/")[0] for name in names)
+        if not graded:
+            logger.info("Baseline has no tests that pass at golden, grading whole packages")
+            self.metadata["baseline"] = {"used": False}
+            return None
+        self._baseline = baseline
+        self._run_filters = {pkg: run_filter(sorted(names)) for pkg, names in graded.items()}
+        # The baseline was recorded with these files at golden (see baselines._run_at).
+        self.metadata["baseline"] = {"used": True, "restored": len(self._restore_task_tests())}
+        logger.info(f"Baseline grading: {sum(len(n) for n in graded.values())} tests in {len(graded)} packages")
+        return sorted(graded)
+
     def _get_target_packages(self) -> list[str]:
-        if not self.test_files: return ["./..."]
-        packages = set()
-        for filepath in self.test_files:
-            if filepath.endswith('.go'):
-                directory = os.path.dirname(filepath)
-                if directory: packages.add(f"./{directory}")
-                else: packages.add(".")
-        
-        if os.path.exists(os.path.join(self.repo_path, "test")):
-             packages.add("./test/...")
+        self._run_filters = {}
+        self._focus = {}
+        self._baseline = None
+        if self.test_selection == "baseline":
+            graded = self._baseline_packages()
+            if graded is not None:
+                return graded
+        if self.test_selection == "focused":
+            focused = self._focused_packages()
+            if focused is not None:
+                return focused
+        packages = target_packages(self.test_files, self.repo_path)
+        # "files" tests the task's packages plus ./test/...; "impact" swaps the
+        # catch-all patterns for the packages the agent's change can affect.
+        if os.environ.get("GRADING_TARGETS", "files") != "impact":
+            return packages
+        impact = impact_targets(self.use_base, self.use_golden, self.repo_path, packages)
+        if impact is None:
+            self.metadata["impact"] = {"used": False}
+            return packages
+        self.metadata["impact"] = {
+            "used": True,
+            "changed_files": len(impact["changed_files"]),
+            "affected": len(impact["affected"]),
+            "packages": impact["packages"],
+        }
+        logger.info(
+            f"Impact analysis: {len(impact['changed_files'])} changed files affect "
+            f"{len(impact['affected'])} packages with tests"
+        )
+        return impact["packages"]
 
-        return sorted(list(packages))
+    def _budget(self) -> float | None:
+        """Seconds the next package may run: its timeout, capped by what is left of the deadline."""
+        limits = []
+        if self.package_timeout_seconds > 0:
+            limits.append(self.package_timeout_seconds)
+        if self._deadline is not None:
+            limits.append(self._deadline - time.time())
+        return min(limits) if limits else None
 
-    def _run_tests(self) -> tuple[str, float, float]:
-        start_time = time.time()
-        
-        logger.info("Ensuring dependencies are up to date...")
+    def _timeout_xml(self, pkg: str, events_path: str | None, message: str) -> str:
+        """
+        JUnit XML for a package killed at its budget.
+
+        Tests that finished before the kill keep their results (from the
+        go test -json events gotestsum recorded); tests still running fail
+        with a Timeout message, or the package gets a Timeout testcase if
+        none was.
+        """
+        stream = Test2JSONStream()
+        if events_path is not None:
+            try:
+                with open(events_path, errors="replace") as f:
+                    for line in f:
+                        stream.feed(line)
+            except OSError as e:
+                # E.g. killed before gotestsum created the file.
+                logger.warning(f"Cannot read test events for {pkg} ({e}), reporting the timeout alone")
+                stream = Test2JSONStream()
+        stream.finish(timed_out=True)
+        suites = [suite for _, suite in stream.junit_suites()]
+        if not any(p.timed_out for p in stream.packages.values()):
+            # Killed while compiling, or never started at all.
+            suite = ET.Element("testsuite", name=pkg, tests="1", failures="1", errors="0", skipped="0")
+            case = ET.SubElement(suite, "testcase", classname=pkg, name="Timeout", time="0.000")
+            ET.SubElement(case, "failure", message="Timeout", type="").text = message
+            suites.append(ET.tostring(suite, encoding="unicode"))
+        return "\n".join(suites)
+
+    def _run_package(self, pkg: str) -> tuple[str, int, str, str, str | None]:
+        """
+        Run one package; returns (pkg, exit code, stdout, stderr, JUnit XML or None).
+
+        Single-package targets run their test binary directly when they can
+        (see _run_binary); everything else runs under gotestsum.
+
+        Waits for the memory gate to admit the package's estimated peak RSS
+        first. Output goes straight to files in self.artifacts; the returned
+        stdout and stderr are only their last OUTPUT_TAIL_CHARS. The package
+        runs in its own process group, which is killed when its budget (see
+        _budget) runs out; the XML then holds the partial results.
+        """
+        rss_bytes = self._estimates.get(pkg, {}).get("rss_bytes", 0)
+        if self._gate is not None:
+            self._gate.acquire(rss_bytes)
+        with self._active_lock:
+            self._active += 1
         try:
-            subprocess.run(
-                ["go", "mod", "tidy"], 
-                cwd=str(self.repo_path), 
-                check=True, 
-                capture_output=True
+            return self._run_gotestsum(pkg)
+        finally:
+            with self._active_lock:
+                self._active -= 1
+            if self._gate is not None:
+                self._gate.release(rss_bytes)
+
+    def _run_gotestsum(self, pkg: str) -> tuple[str, int, str, str, str | None]:
+        budget = self._budget()
+        if budget is not None and budget <= 0:
+            logger.error(f"Package {pkg} not run, grading deadline reached")
+            self._timeouts.append(pkg)
+            return pkg, -1, "", "", self._timeout_xml(pkg, None, "Grading deadline reached before the package ran")
+
+        binary_start = time.time()
+        key = self._binary_keys.get(pkg)
+        # Pinned so a concurrent grading's put() cannot evict it mid-run.
+        with self._binary_cache.pinned(key) if key is not None else contextlib.nullcontext():
+            direct = self._run_binary(pkg, budget)
+        if direct is not None:
+            return direct
+        if budget is not None:
+            # Whatever an abandoned test binary attempt took counts against the package.
+            budget = max(0.0, budget - (time.time() - binary_start))
+
+        logger.info(f"Testing package: {pkg}")
+        
+        safe_pkg_name = pkg.replace('/', '_').replace('.', '').strip('_')
+        if not safe_pkg_name: safe_pkg_name = "root"
+        pkg_xml_file = f"junit_{safe_pkg_name}.xml"
+        
+        out_path = self.artifacts / f"{safe_pkg_name}.out"
+        err_path = self.artifacts / f"{safe_pkg_name}.err"
+        events_path = self.artifacts / f"{safe_pkg_name}.events.json"
+        cmd = [
+            "gotestsum",
+            "--junitfile", pkg_xml_file,
+            "--jsonfile", str(events_path),
+            "--format", "standard-verbose", 
+            "--raw-command",                
+            "--",
+            "go", "test",
+            *GOTESTSUM_FLAGS,
+        ]
+        run = self._run_filter(pkg)
+        if run:
+            cmd.append(f"-run={run}")
+        cmd.append(pkg)
+        
+        timed_out = False
+        usage = None
+        start = time.time()
+        with open(out_path, "w") as out, open(err_path, "w") as err:
+            proc = subprocess.Popen(
+                cmd,
+                cwd=str(self.repo_path),
+                stdout=out,
+                stderr=err,
+                start_new_session=True,
             )
-            subprocess.run(
-                ["go", "mod", "vendor"], 
-                cwd=str(self.repo_path), 
-                check=True, 
-                capture_output=True
+            try:
+                usage = _wait_rusage(proc, budget)
+            except subprocess.TimeoutExpired:
+                kill_group(proc)
+                proc.wait()
+                timed_out = True
+        wall = time.time() - start
+        stdout, stderr = _tail(out_path), _tail(err_path)
+
+        run_seconds = wall if timed_out else min(wall, _package_elapsed(events_path))
+        self._measurements[pkg] = {
+            "compile_seconds": wall - run_seconds,
+            "run_seconds": run_seconds,
+            # ru_maxrss is in KiB and covers the largest of gotestsum, go, the compiler and the test binary.
+            "peak_rss_bytes": usage.ru_maxrss * 1024 if usage else self._estimates.get(pkg, {}).get("rss_bytes", 0),
+        }
+
+        if timed_out:
+            logger.error(f"Package {pkg} TIMED OUT (>{budget:.0f}s)")
+            self._timeouts.append(pkg)
+            xml = self._timeout_xml(pkg, str(events_path), f"Test package timed out after {budget:.0f}s")
+            return pkg, proc.returncode, stdout, stderr, xml
+
+        # The report is streamed from the file when it is merged (see _add_fragment).
+        xml_path = Path(self.repo_path) / pkg_xml_file
+        return pkg, proc.returncode, stdout, stderr, xml_path if xml_path.exists() else None
+
+    def _test_binary(self, pkg: str, safe_pkg_name: str, timeout: float | None) -> tuple[Path | None, resource.struct_rusage | None, bool]:
+        """
+        The package's test binary: (path, build rusage, whether it came from the binary cache).
+
+        Misses are built with `go test -c` and, when the package has a binary
+        key, moved into the cache. The path is None if the build failed, timed
+        out or produced nothing (no test files).
+        """
+        key = self._binary_keys.get(pkg)
+        if key is not None:
+            cached = self._binary_cache.get(key)
+            if cached is not None:
+                self.metadata["binary_cache"]["hits"].append(pkg)
+                return cached, None, True
+            self.metadata["binary_cache"]["misses"].append(pkg)
+        binary = self.artifacts / f"{safe_pkg_name}.test"
+        proc, usage = _run_bounded(
+            ["go", "test", "-c", "-o", str(binary), *BINARY_BUILD_FLAGS, pkg],
+            str(self.repo_path),
+            self.artifacts / f"{safe_pkg_name}.build.out",
+            self.artifacts / f"{safe_pkg_name}.build.err",
+            timeout,
+        )
+        if usage is None or proc.returncode != 0 or not binary.exists():
+            binary.unlink(missing_ok=True)
+            return None, usage, False
+        if key is not None:
+            binary = self._binary_cache.put(key, binary)
+        return binary, usage, False
+
+    def _run_binary(self, pkg: str, budget: float | None) -> tuple[str, int, str, str, str | None] | None:
+        """
+        Run a single-package target by executing its compiled test binary directly.
+
+        Only for large packages, expected to take at least
+        GRADING_BINARY_MIN_SECONDS (see _schedule); smaller ones are cheaper
+        under gotestsum than building, listing and sharding. The binary comes
+        from _test_binary, so reruns of unchanged packages skip the compile
+        and link. go vet does not run here; the compile precheck already vets
+        every target. Packages with at least
+        GRADING_SHARD_MIN_TESTS tests (after the focus filter, if any) are
+        listed with -test.list and dealt into -run shards that run in
+        parallel, as many as grading_shards() gives for the packages running
+        at that point; with every worker busy there is no idle CPU and the
+        package runs unsharded. Each run goes through `go tool test2json` like
+        go test would, and the events are merged into one testsuite. Returns
+        None, and the caller runs the package under gotestsum, for patterns
+        that are not a single package, for packages that are not large, when
+        neither the binary cache nor sharding applies, or when the package
+        does not build.
+        """
+        min_seconds = float(os.environ.get("GRADING_BINARY_MIN_SECONDS", DEFAULT_BINARY_MIN_SECONDS))
+        if pkg.endswith("...") or self._estimates.get(pkg, {}).get("seconds", 0.0) < min_seconds:
+            return None
+        import_path = self._import_path(pkg)
+        shards = grading_shards(self._active)
+        if import_path is None or (pkg not in self._binary_keys and shards < 2):
+            return None
+        start = time.time()
+        deadline = start + budget if budget is not None else None
+
+        def remaining() -> float | None:
+            return None if deadline is None else max(0.0, deadline - time.time())
+
+        safe_pkg_name = pkg.replace('/', '_').replace('.', '').strip('_') or "root"
+        pkg_dir = os.path.join(self.repo_path, pkg.removeprefix("./"))
+        binary, build_usage, cached = self._test_binary(pkg, safe_pkg_name, remaining())
+        if binary is None:
+            return None
+        try:
+            compile_seconds = time.time() - start
+            run = self._run_filter(pkg)
+            filters = [run]
+            # Packages may have finished while this one was building.
+            shards = grading_shards(self._active)
+            if shards >= 2:
+                try:
+                    tests = subprocess.run(
+                        [str(binary), "-test.list", "."], cwd=pkg_dir, capture_output=True, text=True, timeout=remaining(),
+                    )
+                except (subprocess.TimeoutExpired, OSError):
+                    # OSError: gone anyway, e.g. evicted by another process.
+                    return None
+                if tests.returncode != 0:
+                    return None
+                names = [
+                    name for name in tests.stdout.split()
+                    if not name.startswith("Benchmark") and (run is None or re.search(run, name))
+                ]
+                min_tests = int(os.environ.get("GRADING_SHARD_MIN_TESTS", DEFAULT_SHARD_MIN_TESTS))
+                if len(names) >= max(min_tests, 2):
+                    filters = [run_filter(group) for group in split_shards(names, shards)]
+            logger.info(
+                f"Testing package: {pkg} (test binary{' from cache' if cached else ''}"
+                + (f", {len(filters)} shards)" if len(filters) > 1 else ")")
             )
+
+            def run_shard(index: int) -> tuple[Test2JSONStream, int, bool, resource.struct_rusage | None]:
+                events_path = self.artifacts / f"{safe_pkg_name}.shard{index}.events.json"
+                err_path = self.artifacts / f"{safe_pkg_name}.shard{index}.err"
+                cmd = [
+                    "go", "tool", "test2json", "-t", "-p", import_path,
+                    str(binary), "-test.v=test2json", *BINARY_TEST_FLAGS,
+                ]
+                if self.package_timeout_seconds > 0:
+                    # Like go test -timeout: the binary panics past this, failing its running test.
+                    cmd.append(f"-test.timeout={self.package_timeout_seconds:.0f}s")
+                if filters[index]:
+                    cmd.append(f"-test.run={filters[index]}")
+                proc, usage = _run_bounded(cmd, pkg_dir, events_path, err_path, remaining())
+                stream = Test2JSONStream()
+                with open(events_path, errors="replace") as f:
+                    for line in f:
+                        stream.feed(line)
+                stream.finish(timed_out=usage is None)
+                return stream, proc.returncode, usage is None, usage
+
+            with ThreadPoolExecutor(max_workers=len(filters)) as pool:
+                results = list(pool.map(run_shard, range(len(filters))))
+        finally:
+            if pkg not in self._binary_keys:
+                binary.unlink(missing_ok=True)
+
+        merged = Test2JSONStream()
+        for stream, _, _, _ in results:
+            merged.merge(stream)
+        returncode = next((rc for _, rc, _, _ in results if rc != 0), 0)
+        timed_out = any(killed for _, _, killed, _ in results)
+        wall = time.time() - start
+        # The shards run side by side, so their peaks add up; the build ran
+        # before them. A killed shard has no rusage, so a timed-out package
+        # keeps at least its previous estimate.
+        shard_peak = sum(usage.ru_maxrss for *_, usage in results if usage is not None) * 1024
+        peak = max(shard_peak, build_usage.ru_maxrss * 1024 if build_usage else 0)
+        if timed_out:
+            peak = max(peak, self._estimates.get(pkg, {}).get("rss_bytes", 0))
+        self._measurements[pkg] = {
+            "compile_seconds": compile_seconds,
+            "run_seconds": wall - compile_seconds,
+            "peak_rss_bytes": peak,
+        }
+        stderr = "".join(
+            _tail(self.artifacts / f"{safe_pkg_name}.shard{index}.err", OUTPUT_TAIL_CHARS // len(filters))
+            for index in range(len(filters))
+        )
+        if timed_out:
+            logger.error(f"Package {pkg} TIMED OUT (>{budget:.0f}s)")
+            self._timeouts.append(pkg)
+        suites = [suite for _, suite in merged.junit_suites()]
+        xml = ("<testsuites>\n" + "\n".join(suites) + "\n</testsuites>") if suites else None
+        return pkg, returncode, "", stderr, xml
+
+    def _run_package_cached(self, pkg: str) -> tuple[str, int, str, str, str | None, bool]:
+        """_run_package behind the result cache; the last element tells whether it was a hit."""
+        key = self._result_keys.get(pkg)
+        if key is not None and not self.metadata["result_cache"]["fresh"]:
+            record = self._result_cache.get(key)
+            if record is not None:
+                return pkg, 0, "", "", record["xml"], True
+        pkg, returncode, stdout, stderr, xml = self._run_package(pkg)
+        if key is not None and returncode == 0 and xml is not None:
+            self._result_cache.put(key, {"pattern": pkg, "xml": xml.read_text() if isinstance(xml, Path) else xml})
+        return pkg, returncode, stdout, stderr, xml, False
+
+    def _prepare_result_cache(self, target_packages: list[str], engine: str, flags: list[str]) -> dict | None:
+        """
+        Compute result cache keys for the target packages, and for the
+        gotestsum engine test binary cache keys.
+
+        Returns the import graph of the targets, or None when both caches are
+        disabled (GRADING_RESULT_CACHE=0, GRADING_BINARY_CACHE=0) or keys
+        cannot be computed, in which case everything runs and builds.
+        GRADING_FRESH=1 ignores stored results but still records the new ones.
+        Hits and misses land in self.metadata["result_cache"] and
+        self.metadata["binary_cache"].
+        """
+        info = {"enabled": False}
+        self.metadata["result_cache"] = info
+        self.metadata["binary_cache"] = {"enabled": False}
+        self._result_cache = None
+        self._result_keys = {}
+        self._binary_cache = None
+        self._binary_keys = {}
+        self._package_filters = {}
+        use_results = os.environ.get("GRADING_RESULT_CACHE", "1") == "1"
+        use_binaries = engine == "gotestsum" and os.environ.get("GRADING_BINARY_CACHE", "1") == "1"
+        if not (use_results or use_binaries):
+            return None
+        start = time.time()
+        try:
+            digests = workspace_digests(self.repo_path, self.use_base, self.use_golden)
+            keys, graph = package_keys(self.repo_path, target_packages, [engine, *flags], digests)
+        except (subprocess.CalledProcessError, OSError, ValueError) as e:
+            logger.warning(f"Result cache unavailable, running all packages: {e}")
+            info["error"] = str(e)
+            return None
+        if use_binaries:
+            # A test binary is built from the same inputs the results depend
+            # on; the -run filter below does not change it.
+            self._binary_cache = BinaryCache()
+            self._binary_keys = {
+                name: hashlib.sha256(f"test-binary\0{key}".encode()).hexdigest() for name, key in keys.items()
+            }
+            self.metadata["binary_cache"] = {"enabled": True, "hits": [], "misses": []}
+        if not use_results:
+            return graph
+        # Focused runs of a package are cached apart from full ones.
+        self._package_filters = {}
+        for pattern, run in self._run_filters.items():
+            for name in pattern_packages(pattern, graph):
+                self._package_filters[name] = run
+                keys[name] = hashlib.sha256(f"{keys[name]}\0{run}".encode()).hexdigest()
+        self._result_cache = ResultCache()
+        self._result_keys = keys
+        info.update(
+            enabled=True,
+            fresh=os.environ.get("GRADING_FRESH") == "1",
+            key_seconds=time.time() - start,
+            hits=[],
+            misses=[],
+        )
+        return graph
+
+    def _update_dependencies(self):
+        """
+        Run go mod tidy / go mod vendor, skipping what the module fingerprint
+        recorded after the workspace's last successful update shows is
+        unnecessary (setup records none, see setup.forget_module_fingerprint).
+
+        Unchanged go.mod, go.sum and imports with an untouched vendor/ skip
+        both steps; an edited vendor/ alone only re-vendors. The decision
+        lands in self.metadata["dependencies"].
+        """
+        store = FingerprintStore()
+        start = time.time()
+        current = fingerprint(self.repo_path)
+        recorded = store.load(self.repo_path)
+        fingerprint_seconds = time.time() - start
+
+        tidy = ["go", "mod", "tidy"]
+        vendor = ["go", "mod", "vendor"]
+        if os.environ.get("GO_MOD_FINGERPRINT", "1") != "1" or not inputs_match(recorded, current):
+            decision, steps = "tidy+vendor", [tidy, vendor]
+        elif recorded.get("vendor") != current["vendor"]:
+            decision, steps = "vendor", [vendor]
+        else:
+            decision, steps = "skipped", []
+        estimate = store.full_update_seconds()
+        info = {"decision": decision, "fingerprint_seconds": fingerprint_seconds}
+        self.metadata["dependencies"] = info
+
+        if not steps:
+            info["estimated_seconds_saved"] = estimate
+            logger.info("Module inputs unchanged since the last update, skipping go mod tidy/vendor.")
+            return
+
+        logger.info(f"Ensuring dependencies are up to date ({decision})...")
+        start = time.time()
+        try:
+            for cmd in steps:
+                subprocess.run(
+                    cmd, 
+                    cwd=str(self.repo_path), 
+                    check=True, 
+                    capture_output=True
+                )
             logger.info("Dependencies updated successfully.")
         except subprocess.CalledProcessError as e:
             logger.warning(f"Dependency update warning: {e}")
             if e.stderr:
                 logger.warning(f"go mod error details: {e.stderr.decode('utf-8', errors='replace')}")
+            # The tree is in an unknown state; make the next grading do the full update.
+            store.clear(self.repo_path)
+            info["seconds"] = time.time() - start
+            return
+        info["seconds"] = time.time() - start
+        if decision == "tidy+vendor":
+            store.record_full_update(info["seconds"])
+        elif estimate is not None:
+            info["estimated_seconds_saved"] = max(0.0, estimate - info["seconds"])
+        store.save(self.repo_path, fingerprint(self.repo_path))
 
-        target_packages = self._get_target_packages()
-        logger.info(f"Targeted Testing: {len(target_packages)} packages")
-        
-        merged_xml_parts = []
-        
+    def _add_fragment(self, pkg: str, xml: str | Path, stdout: str, stderr: str):
+        """
+        Count one package's JUnit XML (text, or a file read in chunks) and
+        append it to the merged report file.
+
+        Each chunk is written out as the tally parses it, so a report file is
+        never held in memory whole. A malformed fragment is cut back out of
+        the report and replaced by an error fragment.
+        """
+        start = self._junit.tell()
+
+        def chunks() -> Iterator[str]:
+            if isinstance(xml, Path):
+                with open(xml, errors="replace") as f:
+                    for chunk in iter(lambda: f.read(XML_CHUNK_CHARS), ""):
+                        self._junit.write(chunk.replace('<?xml version="1.0" encoding="UTF-8"?>', ''))
+                        yield chunk
+            else:
+                self._junit.write(xml.replace('<?xml version="1.0" encoding="UTF-8"?>', ''))
+                yield xml
+
+        if self._tally.feed(pkg, chunks()):
+            self._junit.write("\n")
+        else:
+            self._junit.seek(start)
+            self._junit.truncate()
+            self._add_error_fragment(pkg, "Malformed JUnit XML", stdout, stderr)
+
+    def _add_error_fragment(self, pkg: str, message: str, stdout: str, stderr: str):
+        error_xml = self._format_junit_xml(
+            pkg, 
+            message, 
+            stdout or "", 
+            stderr or ""
+        ).replace('<?xml version="1.0" encoding="UTF-8"?>', '')
+        self._tally.feed(pkg, [error_xml])
+        self._junit.write(error_xml + "\n")
+
+    def _run_packages_gotestsum(self, target_packages: list[str]) -> tuple[int, int]:
+        """One gotestsum process per package; returns (packages, passed packages)."""
         total_packages = 0 
         passed_packages = 0
 
-        for pkg in target_packages:
-            logger.info(f"Testing package: {pkg}")
-            
-            safe_pkg_name = pkg.replace('/', '_').replace('.', '').strip('_')
-            if not safe_pkg_name: safe_pkg_name = "root"
-            pkg_xml_file = f"junit_{safe_pkg_name}.xml"
-            
-            cmd = [
-                "gotestsum",
-                "--junitfile", pkg_xml_file,
-                "--format", "standard-verbose", 
-                "--raw-command",                
-                "--",
-                "go", "test",
-                "-mod=vendor", 
-                "-short",
-                "-v",
-                "-json",                        
-                pkg
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                cwd=str(self.repo_path),
-                capture_output=True,
-                text=True
+        graph = self._prepare_result_cache(target_packages, "gotestsum", GOTESTSUM_FLAGS)
+        if graph is not None:
+            # A pattern's key combines the keys of every package it expands
+            # to; only single-package patterns have a test binary.
+            pattern_keys = {}
+            binary_keys = {}
+            for pkg in target_packages:
+                matched = pattern_packages(pkg, graph)
+                if matched and self._result_keys:
+                    combined = "\n".join(f"{name}\0{self._result_keys[name]}" for name in matched)
+                    pattern_keys[pkg] = hashlib.sha256(combined.encode()).hexdigest()
+                if len(matched) == 1 and not pkg.endswith("...") and matched[0] in self._binary_keys:
+                    binary_keys[pkg] = self._binary_keys[matched[0]]
+            self._result_keys = pattern_keys
+            self._binary_keys = binary_keys
+        cache_info = self.metadata["result_cache"]
+
+        workers = 1 if os.environ.get("GRADING_SERIAL") == "1" else grading_workers(len(target_packages))
+        order = self._schedule(target_packages)
+        logger.info(f"Running packages with {workers} worker(s), longest first: {order}")
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pkg: pool.submit(self._run_package_cached, pkg) for pkg in order}
+            # Results are collected in target order, so the merged XML does
+            # not depend on the schedule or on which package finishes first.
+            for pkg, returncode, stdout, stderr, xml, cached in (futures[pkg].result() for pkg in target_packages):
+                if cache_info["enabled"]:
+                    cache_info["hits" if cached else "misses"].append(pkg)
+                if returncode != 0 and stderr:
+                    logger.warning(f"--- Stderr for {pkg} (tail) ---\n{stderr}")
+
+                total_packages += 1
+                if returncode == 0:
+                    logger.info(f"Package {pkg} PASSED" + (" (cached)" if cached else ""))
+                    passed_packages += 1
+                elif pkg in self._timeouts:
+                    logger.warning(f"Package {pkg} TIMED OUT, keeping the tests it completed")
+                else:
+                    logger.warning(f"Package {pkg} FAILED (exit {returncode})")
+
+                if xml is None:
+                    logger.error(f"No JUnit XML generated for {pkg}, assuming build failure.")
+                    self._add_error_fragment(pkg, "Build/Execution Failure", stdout, stderr)
+                else:
+                    self._add_fragment(pkg, xml, stdout, stderr)
+
+        self._history.record(self._history_key(), self._measurements)
+        self.metadata["schedule"]["memory_waits"] = self._gate.waits if self._gate else 0
+        return total_packages, passed_packages
+
+    def _history_key(self) -> str:
+        return self.problem_id or (self.use_golden or "grading")[:12]
+
+    def _schedule(self, target_packages: list[str]) -> list[str]:
+        """
+        Start order for the gotestsum engine: longest expected compile+run
+        first, from this task's package history or, for packages it has not
+        seen, the size of their Go source. Also sets up the memory gate,
+        which holds packages back while the estimated peak RSS of those
+        running would exceed GRADING_MEMORY_BUDGET_BYTES (default: 80% of
+        the memory available now; 0 disables the gate).
+        """
+        self._estimates = estimates(self._history.load(self._history_key()), self.repo_path, target_packages)
+        order = lpt_order(target_packages, self._estimates)
+
+        budget = os.environ.get("GRADING_MEMORY_BUDGET_BYTES")
+        budget_bytes = int(budget) if budget is not None else int(available_memory() * 0.8)
+        self._gate = MemoryGate(budget_bytes) if budget_bytes > 0 else None
+        self.metadata["schedule"] = {
+            "order": order,
+            "estimates": self._estimates,
+            "memory_budget_bytes": budget_bytes,
+        }
+        return order
+
+    def _stream_go_test(self, cmd: list[str], stream: Test2JSONStream, killed: threading.Event, budget: float | None) -> int:
+        """
+        Run one `go test -json` into stream, killing it (and setting killed)
+        after budget seconds. The raw events are appended to go_test.json in
+        self.artifacts.
+        """
+        proc = subprocess.Popen(
+            cmd,
+            cwd=str(self.repo_path),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            start_new_session=True,
+        )
+
+        def on_deadline():
+            killed.set()
+            logger.error("Grading deadline reached, killing go test")
+            kill_group(proc)
+
+        timer = None
+        if budget is not None:
+            timer = threading.Timer(budget, on_deadline)
+            timer.daemon = True
+            timer.start()
+        with open(self.artifacts / "go_test.json", "a") as raw:
+            for line in proc.stdout:
+                raw.write(line)
+                package = stream.feed(line)
+                if package is None:
+                    continue
+                if package.status == "pass":
+                    logger.info(f"Package {package.name} PASSED ({len(package.tests)} tests, {package.elapsed:.1f}s)")
+                elif package.status == "fail":
+                    logger.warning(
+                        f"Package {package.name} FAILED ({len(package.failed_tests)} of {len(package.tests)} tests failed)"
+                    )
+                    for test in package.failed_tests:
+                        logger.warning(f"--- {test.name} ---\n{''.join(test.output)}")
+        returncode = proc.wait()
+        if timer is not None:
+            timer.cancel()
+        return returncode
+
+    def _run_packages_json(self, target_packages: list[str]) -> tuple[int, int]:
+        """
+        A single `go test -json` over all packages, parsed as it streams.
+
+        The go command schedules compiles and test binaries across packages
+        itself, and nothing is written into the repo. Packages are counted per
+        Go package rather than per pattern, since ./test/... expands to many.
+        Packages with a result cache hit are left out of the run.
+        """
+        self._prepare_result_cache(target_packages, "json", JSON_FLAGS)
+        cache_info = self.metadata["result_cache"]
+        cached = {}
+        if cache_info["enabled"]:
+            for name, key in sorted(self._result_keys.items()):
+                record = None if cache_info["fresh"] else self._result_cache.get(key)
+                if record is None:
+                    cache_info["misses"].append(name)
+                else:
+                    cache_info["hits"].append(name)
+                    cached[name] = record
+                    logger.info(f"Package {name} {'PASSED' if record['status'] == 'pass' else 'SKIPPED'} (cached)")
+            run_targets = cache_info["misses"]
+        else:
+            run_targets = target_packages
+
+        stream = Test2JSONStream()
+        returncode = 0
+        killed = threading.Event()
+        # -run applies to every package of a go test invocation, so packages
+        # with different focus filters need separate runs.
+        groups: dict[str | None, list[str]] = {}
+        for target in run_targets:
+            groups.setdefault(self._run_filter(target), []).append(target)
+        for run, targets in groups.items():
+            budget = None if self._deadline is None else self._deadline - time.time()
+            if budget is not None and budget <= 0:
+                logger.error("Grading deadline reached before go test started")
+                killed.set()
+                break
+            cmd = ["go", "test", *JSON_FLAGS]
+            if self.package_timeout_seconds > 0:
+                # Each test binary panics (failing its running test) past this.
+                cmd.insert(2, f"-timeout={self.package_timeout_seconds:.0f}s")
+            if run:
+                cmd.append(f"-run={run}")
+            returncode = self._stream_go_test([*cmd, *targets], stream, killed, budget) or returncode
+            if killed.is_set():
+                break
+        if run_targets:
+            stream.finish(timed_out=killed.is_set())
+            if stream.stray:
+                logger.warning(f"--- go test stderr ---\n{''.join(stream.stray)}")
+
+        suites = dict(stream.junit_suites())
+        statuses = {name: package.status for name, package in stream.packages.items()}
+        if run_targets and not stream.packages:
+            logger.error(f"go test produced no results (exit {returncode}), assuming build failure.")
+            self._add_error_fragment(
+                " ".join(run_targets),
+                "Timeout" if killed.is_set() else "Build/Execution Failure",
+                "",
+                "".join(stream.stray),
             )
-            
-            if result.stdout:
-                logger.info(f"--- Output for {pkg} ---")
-                logger.info(result.stdout)
-            if result.stderr:
-                logger.warning(f"--- Stderr for {pkg} ---")
-                logger.warning(result.stderr)
-
-            total_packages += 1
-            if result.returncode == 0:
-                logger.info(f"Package {pkg} PASSED")
-                passed_packages += 1
-            else:
-                logger.warning(f"Package {pkg} FAILED (exit {result.returncode})")
-            
-            xml_path = Path(self.repo_path) / pkg_xml_file
-            if xml_path.exists():
-                with open(xml_path) as f:
-                    content = f.read().replace('<?xml version="1.0" encoding="UTF-8"?>', '')
-                    merged_xml_parts.append(content)
+            # The whole run counts as one failed package.
+            statuses[" ".join(run_targets)] = "fail"
+
+        for name, key in self._result_keys.items():
+            if name in suites and statuses[name] in ("pass", "skip"):
+                self._result_cache.put(key, {"status": statuses[name], "xml": suites[name]})
+        for name, record in cached.items():
+            suites[name] = record["xml"]
+            statuses[name] = record["status"]
+
+        for name in sorted(suites):
+            self._add_fragment(name, suites[name], "", "")
+        self._timeouts.extend(name for name, package in stream.packages.items() if package.timed_out)
+        tested = [status for status in statuses.values() if status != "skip"]
+        passed = sum(1 for status in tested if status == "pass")
+        return len(tested), passed
+
+    def _compile_package(self, pkg: str) -> tuple[str, Test2JSONStream | None]:
+        """Build one pattern's tests without running them; the stream is None if that could not finish."""
+        budget = self._budget()
+        if budget is not None and budget <= 0:
+            return pkg, None
+        proc = subprocess.Popen(
+            ["go", "test", *PRECHECK_FLAGS, pkg],
+            cwd=str(self.repo_path),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            start_new_session=True,
+        )
+        try:
+            output, _ = proc.communicate(timeout=budget)
+        except subprocess.TimeoutExpired:
+            kill_group(proc)
+            proc.communicate()
+            logger.warning(f"Compile precheck of {pkg} timed out, leaving it to the test run")
+            return pkg, None
+        stream = Test2JSONStream()
+        for line in output.splitlines():
+            stream.feed(line)
+        stream.finish()
+        return pkg, stream
+
+    def _precheck(self, target_packages: list[str]) -> tuple[list[str], list[Test2JSONStream]]:
+        """
+        Compile every target's tests in parallel before running anything.
+
+        Returns the targets still worth running and the precheck streams of
+        those that are not: patterns in which no package compiled. Their build
+        failures score exactly as the test run would have scored them. Skipped
+        with GRADING_PRECHECK=0; compile diagnostics land in
+        self.metadata["precheck"].
+        """
+        info = {"enabled": os.environ.get("GRADING_PRECHECK", "1") == "1"}
+        self.metadata["precheck"] = info
+        if not info["enabled"] or not target_packages:
+            return target_packages, []
+
+        logger.info(f"Compile precheck: building tests of {len(target_packages)} packages...")
+        remaining = []
+        broken = []
+        diagnostics = []
+        failed_packages = []
+        with ThreadPoolExecutor(max_workers=grading_workers(len(target_packages))) as pool:
+            for pkg, stream in pool.map(self._compile_package, target_packages):
+                if stream is None:
+                    remaining.append(pkg)
+                    continue
+                failed = [name for name, package in stream.packages.items() if package.build_failed]
+                failed_packages.extend(failed)
+                diagnostics.extend(stream.diagnostics())
+                if failed and len(failed) == len(stream.packages):
+                    logger.error(f"{pkg} does not compile, skipping its tests")
+                    logger.warning(f"--- Build output for {pkg} ---\n{''.join(stream.stray)}")
+                    broken.append(stream)
+                else:
+                    remaining.append(pkg)
+
+        info.update(
+            failed_packages=sorted(failed_packages),
+            skipped_targets=[pkg for pkg in target_packages if pkg not in remaining],
+            diagnostics=diagnostics[:MAX_DIAGNOSTICS],
+            diagnostics_truncated=len(diagnostics) > MAX_DIAGNOSTICS,
+        )
+        if failed_packages:
+            logger.warning(f"Compile precheck: {len(failed_packages)} packages failed to build")
+        return remaining, broken
+
+    def _run_tests(self) -> tuple[str, float, float]:
+        start_time = time.time()
+        
+        self._update_dependencies()
+        dependencies_done = time.time()
+
+        target_packages = self._get_target_packages()
+        logger.info(f"Targeted Testing: {len(target_packages)} packages")
+
+        self._tally = JUnitTally()
+        self._timeouts = []
+        engine = os.environ.get("GRADING_ENGINE", "gotestsum")
+        run_packages, broken = self._precheck(target_packages)
+        compile_done = time.time()
+
+        # Fragments are appended to the merged report file as they come in.
+        self._junit = open(self.artifacts / "junit.xml", "w+")
+        self._junit.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+        for stream in broken:
+            for name, suite in stream.junit_suites():
+                self._add_fragment(name, suite, "", "")
+        # Each skipped target is one failed package, per pattern or per Go
+        # package like the engine would have counted it.
+        failed_packages = sum(len(s.packages) for s in broken) if engine == "json" else len(broken)
+
+        if not run_packages:
+            logger.error("Nothing compiles, stopping before the test run")
+            self.metadata["precheck"]["stopped_early"] = True
+            total_packages, passed_packages = failed_packages, 0
+        else:
+            # "gotestsum" runs one gotestsum process per package; "json" runs a
+            # single `go test -json` and builds the JUnit XML itself.
+            if engine == "json":
+                total_packages, passed_packages = self._run_packages_json(run_packages)
             else:
-                logger.error(f"No JUnit XML generated for {pkg}, assuming build failure.")
-                error_xml = self._format_junit_xml(
-                    pkg, 
-                    "Build/Execution Failure", 
-                    result.stdout or "", 
-                    result.stderr or ""
-                ).replace('<?xml version="1.0" encoding="UTF-8"?>', '')
-                merged_xml_parts.append(error_xml)
+                total_packages, passed_packages = self._run_packages_gotestsum(run_packages)
+            total_packages += failed_packages
+        self.metadata["timing"] = {
+            "dependencies_seconds": dependencies_done - start_time,
+            "compile_seconds": compile_done - dependencies_done,
+            "test_seconds": time.time() - compile_done,
+        }
 
         duration = time.time() - start_time
 
-        final_xml = '<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n' + "\n".join(merged_xml_parts) + "\n</testsuites>"
-        
-        total_tests = 0
-        total_failures = 0
+        if self._focus:
+            self._add_missing_focus()
+        self._junit.write("</testsuites>")
+        self._junit.seek(0)
+        final_xml = self._junit.read()
+        self._junit.close()
         
-        try:
-            root = ET.fromstring(final_xml)
-            for testsuite in root.findall(".//testsuite"):
-                total_tests += int(testsuite.get("tests", 0))
-                total_failures += int(testsuite.get("failures", 0))
-                total_failures += int(testsuite.get("errors", 0))
-            
-            if total_tests > 0:
-                test_score = float(total_tests - total_failures) / float(total_tests)
+        total_tests = self._tally.tests
+        total_failures = self._tally.failures
+        if total_tests > 0:
+            test_score = float(total_tests - total_failures) / float(total_tests)
+        else:
+            # With -run filters, a package that ran no test passed nothing.
+            if total_packages > 0 and not self._run_filters:
+                test_score = float(passed_packages) / float(total_packages)
             else:
-                if total_packages > 0:
-                    test_score = float(passed_packages) / float(total_packages)
-                else:
-                    test_score = 0.0
-                
-            logger.info(f"Test Results: {total_tests - total_failures} passed out of {total_tests} total tests.")
-            logger.info(f"Calculated Score: {test_score:.4f}")
+                test_score = 0.0
             
-        except Exception as e:
-            logger.error(f"Failed to parse JUnit XML for scoring: {e}")
-            test_score = 0.0
+        logger.info(f"Test Results: {total_tests - total_failures} passed out of {total_tests} total tests.")
+        if self._baseline is not None:
+            result = baseline_score(self._baseline, self._tally.outcomes)
+            self.metadata["baseline"].update(result)
+            test_score = result["score"]
+            logger.info(
+                f"Against the baseline: {result['fail_to_pass']['passed']}/{result['fail_to_pass']['total']} "
+                f"FAIL_TO_PASS, {result['pass_to_pass']['passed']}/{result['pass_to_pass']['total']} PASS_TO_PASS"
+            )
+        logger.info(f"Calculated Score: {test_score:.4f}")
+        self.metadata["tests"] = self._tally.summary()
+        self.metadata["failed_tests"] = dict(self._tally.failure_output)
+        logger.info(f"Full test output in {self.artifacts}")
+        self.metadata["timeouts"] = {
+            "deadline_seconds": self.deadline_seconds,
+            "package_timeout_seconds": self.package_timeout_seconds,
+            "timed_out": sorted(self._timeouts),
+        }
 
         return final_xml, duration, test_score
 
     def run_grading(self) -> tuple[float, dict]:
         """Run the complete grading workflow."""
         total_start = time.time()
+        self._deadline = total_start + self.deadline_seconds if self.deadline_seconds > 0 else None
+        artifacts = contextlib.ExitStack()
+        self.artifacts = artifacts.enter_context(open_artifacts(self.problem_id or (self.use_golden or "grading")[:12]))
+        self.metadata["artifacts"] = str(self.artifacts)
         logger.info("=" * 60)
         logger.info("GRADING STARTED")
         logger.info("=" * 60)
@@ -407,10 +1499,13 @@ class GradingRunner:
             return score, {
                 "junit": junit_xml,
                 "test_duration": test_duration,
-                "total_duration": total_duration
+                "total_duration": total_duration,
+                **self.metadata,
             }
             
         except Exception as e:
             total_duration = time.time() - total_start
             logger.exception(f"Grading failed: {e}")
-            return 0.0, {"error": str(e)}
\ No newline at end of file
+            return 0.0, {"error": str(e), **self.metadata}
+        finally:
+            artifacts.close()
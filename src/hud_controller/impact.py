@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import subprocess
+from collections import deque
+from pathlib import Path
+
+from .tree_cache import TreeCache, default_tree_cache
+from .utils import atomic_write_json
+from .workspace import WorkspaceState, changed_files
+
+logger = logging.getLogger(__name__)
+
+# Changes to these invalidate every package, so impact analysis gives up.
+MODULE_FILES = ("go.mod", "go.sum", "vendor/modules.txt")
+
+
+def _go_list(tree: Path, patterns: tuple[str, ...]) -> list[dict]:
+    result = subprocess.run(
+        ["go", "list", "-e", "-deps", "-test", "-json", *patterns],
+        cwd=str(tree),
+        env={**os.environ, "GOFLAGS": "-mod=vendor"},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    decoder = json.JSONDecoder()
+    packages = []
+    pos = 0
+    out = result.stdout
+    while True:
+        while pos < len(out) and out[pos].isspace():
+            pos += 1
+        if pos >= len(out):
+            return packages
+        package, pos = decoder.raw_decode(out, pos)
+        packages.append(package)
+
+
+def build_graph(tree: Path, patterns: tuple[str, ...] = ("./...",)) -> dict:
+    """
+    Import graph of every non-standard package the tests of `patterns` build.
+
+    Test variants ("p [p.test]") and external test packages (p_test) are
+    folded into the package they test, so a package's deps cover everything
+    its tests compile. Returns {"packages": {import path: {"dir", "deps",
+    "has_tests", "root"}}} with dirs relative to the tree ("" for its root);
+    "root" marks packages matched by the patterns themselves.
+    """
+    root = os.path.realpath(tree)
+    packages: dict[str, dict] = {}
+    for info in _go_list(tree, patterns):
+        if info.get("Standard"):
+            continue
+        import_path = info["ImportPath"].split(" ")[0]
+        name = info.get("ForTest") or import_path
+        if name.endswith(".test") and not info.get("ForTest"):
+            # Generated test main package.
+            continue
+        directory = os.path.relpath(os.path.realpath(info.get("Dir", root)), root)
+        if directory.startswith(".."):
+            continue
+        if directory == ".":
+            directory = ""
+        entry = packages.setdefault(name, {"dir": directory, "deps": set(), "has_tests": False, "root": False})
+        if import_path == name:
+            entry["dir"] = directory
+        if not info.get("DepOnly"):
+            entry["root"] = True
+        entry["deps"].update(dep.split(" ")[0] for dep in info.get("Imports", []))
+        if info.get("TestGoFiles") or info.get("XTestGoFiles"):
+            entry["has_tests"] = True
+    for name, entry in packages.items():
+        entry["deps"] = sorted(dep for dep in entry["deps"] if dep in packages and dep != name)
+    return {"packages": packages}
+
+
+def load_graph(tree_cache: TreeCache, key: str) -> dict | None:
+    """The cached import graph for a tree cache entry, built on first use."""
+    entry = tree_cache.entry_path(key)
+    path = entry / "graph.json"
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    except ValueError:
+        logger.warning(f"Import graph for {key[:17]} is damaged, rebuilding")
+    if not tree_cache.meta(key):
+        return None
+
+    logger.info(f"Building import graph for {key[:17]}...")
+    graph = build_graph(entry / "tree")
+    atomic_write_json(path, graph, private=False)
+    return graph
+
+
+def _owning_package(rel: str, by_dir: dict[str, list[str]]) -> list[str]:
+    directory = os.path.dirname(rel)
+    while True:
+        if directory in by_dir:
+            return by_dir[directory]
+        if not directory:
+            return []
+        directory = os.path.dirname(directory)
+
+
+def affected_packages(graph: dict, changed: list[str]) -> list[str] | None:
+    """
+    Import paths of packages with tests that transitively depend on a changed file.
+
+    A changed file belongs to the package in its directory or, for testdata
+    and other non-Go files, the nearest enclosing package. Returns None when a
+    module-wide file changed and everything has to be treated as affected.
+    """
+    if any(rel in MODULE_FILES for rel in changed):
+        return None
+    packages = graph["packages"]
+    by_dir: dict[str, list[str]] = {}
+    for name, entry in packages.items():
+        by_dir.setdefault(entry["dir"], []).append(name)
+    reverse: dict[str, list[str]] = {}
+    for name, entry in packages.items():
+        for dep in entry["deps"]:
+            reverse.setdefault(dep, []).append(name)
+
+    seeds = {name for rel in changed for name in _owning_package(rel, by_dir)}
+    affected = set(seeds)
+    queue = deque(seeds)
+    while queue:
+        for user in reverse.get(queue.popleft(), []):
+            if user not in affected:
+                affected.add(user)
+                queue.append(user)
+    return sorted(name for name in affected if packages[name]["has_tests"])
+
+
+def impact_targets(base: str, golden: str, repo_path: str, task_packages: list[str]) -> dict | None:
+    """
+    Package patterns to test for the agent's change: the task's own packages
+    plus every local package with tests affected by a changed file.
+
+    Returns {"packages", "changed_files", "affected"} or None when impact
+    analysis is unavailable (no tree cache entry or setup snapshot for this
+    workspace, or a module-wide change), in which case callers should use
+    their usual selection.
+    """
+    tree_cache = default_tree_cache()
+    key = tree_cache.key(base, golden)
+    with tree_cache.lookup(base, golden) as tree:
+        if tree is None:
+            return None
+        state = WorkspaceState(tree_cache, repo_path).load()
+        if state is None or state["key"] != key:
+            return None
+        manifest = tree_cache.manifest(key)
+        if manifest is None:
+            return None
+        changed = changed_files(repo_path, manifest, state["stats"])
+        try:
+            graph = load_graph(tree_cache, key)
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"go list failed, impact analysis unavailable: {e.stderr}")
+            return None
+    if graph is None:
+        return None
+
+    affected = affected_packages(graph, changed)
+    if affected is None:
+        logger.info("Module files changed, impact analysis falls back to the full selection")
+        return None
+    packages = graph["packages"]
+    local = [
+        f"./{packages[name]['dir']}" if packages[name]["dir"] else "."
+        for name in affected
+        if not packages[name]["dir"].startswith("vendor" + os.sep)
+    ]
+    selected = sorted(set(p for p in task_packages if not p.endswith("/...")) | set(local))
+    return {"packages": selected, "changed_files": changed, "affected": affected}
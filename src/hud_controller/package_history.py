@@ -0,0 +1,135 @@
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from .utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest grading in the recorded durations.
+SMOOTHING = 0.5
+# Size heuristic for packages without history: test source bytes per second of compile+run.
+HEURISTIC_BYTES_PER_SECOND = 10_000
+DEFAULT_RSS_BYTES = 512 * 1024 ** 2
+
+
+class PackageHistory:
+    """
+    How long each (task, package) took to grade and how much memory it
+    needed, one JSON file per task.
+
+    Durations are exponentially smoothed across gradings; peak RSS keeps the
+    maximum seen, so memory admission errs on the safe side.
+    """
+
+    def __init__(self, root: str | None = None):
+        self.root = Path(root or os.environ.get("PACKAGE_HISTORY_DIR", "/evaluation/package_history"))
+
+    def _path(self, task: str) -> Path:
+        return self.root / f"{task.replace('/', '_')}.json"
+
+    def load(self, task: str) -> dict[str, dict]:
+        try:
+            with open(self._path(task)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def record(self, task: str, measurements: dict[str, dict]):
+        """Merge {package: {"compile_seconds", "run_seconds", "peak_rss_bytes"}} into the task's history."""
+        if not measurements:
+            return
+        history = self.load(task)
+        for pkg, m in measurements.items():
+            entry = history.get(pkg)
+            if entry is None:
+                history[pkg] = {**m, "runs": 1}
+                continue
+            for field in ("compile_seconds", "run_seconds"):
+                entry[field] = SMOOTHING * m[field] + (1 - SMOOTHING) * entry[field]
+            entry["peak_rss_bytes"] = max(entry["peak_rss_bytes"], m["peak_rss_bytes"])
+            entry["runs"] += 1
+
+        atomic_write_json(self._path(task), history, indent=1, sort_keys=True)
+
+
+def source_bytes(repo_path: str, pattern: str) -> int:
+    """Bytes of Go source a package pattern ("./dir", "./dir/...", ".") covers."""
+    rel = "" if pattern == "." else pattern.removeprefix("./")
+    recursive = rel == "..." or rel.endswith("/...")
+    if recursive:
+        rel = rel[: -len("...")].rstrip("/")
+    top = os.path.join(repo_path, rel)
+    total = 0
+    for dirpath, dirnames, filenames in os.walk(top):
+        dirnames[:] = [
+            d for d in dirnames if recursive and not (d.startswith((".", "_")) or d in ("testdata", "vendor"))
+        ]
+        for name in filenames:
+            if name.endswith(".go"):
+                try:
+                    total += os.lstat(os.path.join(dirpath, name)).st_size
+                except FileNotFoundError:
+                    pass
+    return total
+
+
+def estimates(history: dict[str, dict], repo_path: str, packages: list[str]) -> dict[str, dict]:
+    """
+    Expected {"seconds", "rss_bytes", "source"} per package: from history when
+    the package was graded before, else from the size of its Go source.
+    """
+    seen_rss = sorted(entry["peak_rss_bytes"] for entry in history.values())
+    fallback_rss = seen_rss[len(seen_rss) // 2] if seen_rss else DEFAULT_RSS_BYTES
+    result = {}
+    for pkg in packages:
+        entry = history.get(pkg)
+        if entry is not None:
+            result[pkg] = {
+                "seconds": entry["compile_seconds"] + entry["run_seconds"],
+                "rss_bytes": entry["peak_rss_bytes"],
+                "source": "history",
+            }
+        else:
+            result[pkg] = {
+                "seconds": 1.0 + source_bytes(repo_path, pkg) / HEURISTIC_BYTES_PER_SECOND,
+                "rss_bytes": fallback_rss,
+                "source": "heuristic",
+            }
+    return result
+
+
+def lpt_order(packages: list[str], estimated: dict[str, dict]) -> list[str]:
+    """Longest-processing-time-first start order (ties keep the given order)."""
+    return sorted(packages, key=lambda pkg: -estimated[pkg]["seconds"])
+
+
+class MemoryGate:
+    """
+    Admits packages while the estimated peak RSS of those running fits in
+    budget_bytes. A package is always admitted when nothing else is running,
+    so one that is larger than the whole budget still runs, alone.
+    """
+
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.in_use = 0
+        self.waits = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, rss_bytes: int):
+        def fits() -> bool:
+            return self.in_use == 0 or self.in_use + rss_bytes <= self.budget_bytes
+
+        with self._cond:
+            if not fits():
+                self.waits += 1
+                self._cond.wait_for(fits)
+            self.in_use += rss_bytes
+
+    def release(self, rss_bytes: int):
+        with self._cond:
+            self.in_use -= rss_bytes
+            self._cond.notify_all()
@@ -0,0 +1,179 @@
+import hashlib
+import json
+import logging
+import os
+import stat
+import subprocess
+from collections import deque
+from pathlib import Path
+
+from .impact import build_graph
+from .tree_cache import default_tree_cache, hash_file, walk_files
+from .utils import atomic_write_json
+from .workspace import WorkspaceState, stat_key
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 5000
+
+# go env settings that change what a test binary is built from or runs with.
+_GO_ENV = ("GOVERSION", "GOOS", "GOARCH", "GOAMD64", "CGO_ENABLED", "GOFLAGS", "GOEXPERIMENT")
+
+
+def _is_source(rel: str) -> bool:
+    """True for Go files the go command compiles as part of their directory's package."""
+    if not rel.endswith(".go"):
+        return False
+    return not any(part == "testdata" or part.startswith((".", "_")) for part in rel.split(os.sep)[:-1])
+
+
+def workspace_digests(repo_path: str, base: str, golden: str | None) -> dict[str, str]:
+    """
+    Content digest of every workspace file outside .git.
+
+    Files whose stat still matches the setup snapshot take their digest from
+    the tree cache manifest instead of being hashed, like changed_files.
+    gotestsum's junit_*.xml reports at the top level are left out.
+    """
+    tree_cache = default_tree_cache()
+    key = tree_cache.key(base, golden)
+    manifest: dict[str, list] = {}
+    stats: dict[str, list[int]] = {}
+    with tree_cache.lookup(base, golden) as tree:
+        state = WorkspaceState(tree_cache, repo_path).load() if tree is not None else None
+        if state is not None and state["key"] == key:
+            manifest = tree_cache.manifest(key) or {}
+            stats = state["stats"]
+
+    digests = {}
+    for rel, st in walk_files(repo_path, skip=(".git",)):
+        if os.sep not in rel and rel.startswith("junit_") and rel.endswith(".xml"):
+            continue
+        if not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)):
+            continue
+        if rel in manifest and stats.get(rel) == stat_key(st):
+            digests[rel] = manifest[rel][0]
+        else:
+            digests[rel] = hash_file(os.path.join(repo_path, rel), st)
+    return digests
+
+
+def _go_env(repo_path: str) -> dict[str, str]:
+    result = subprocess.run(
+        ["go", "env", "-json", *_GO_ENV], cwd=repo_path, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout)
+
+
+def _closure(packages: dict[str, dict], name: str) -> set[str]:
+    seen = {name}
+    queue = deque([name])
+    while queue:
+        for dep in packages[queue.popleft()]["deps"]:
+            if dep not in seen:
+                seen.add(dep)
+                queue.append(dep)
+    return seen
+
+
+def package_keys(repo_path: str, patterns: list[str], flags: list[str], digests: dict[str, str]) -> tuple[dict[str, str], dict]:
+    """
+    Result cache key for every package the patterns match.
+
+    A key covers the Go files of the package and of every package its tests
+    import transitively (vendored ones included), the go version and build
+    settings, the test flags, and every non-Go file in the workspace, since
+    tests read testdata and config files the import graph knows nothing
+    about. Returns ({import path: key}, import graph from build_graph).
+    """
+    graph = build_graph(Path(repo_path), tuple(patterns))["packages"]
+
+    sources: dict[str, list[str]] = {}
+    data = hashlib.sha256()
+    for rel in sorted(digests):
+        if _is_source(rel):
+            sources.setdefault(os.path.dirname(rel), []).append(f"{os.path.basename(rel)}\0{digests[rel]}")
+        else:
+            data.update(f"{rel}\0{digests[rel]}\n".encode())
+    common = json.dumps(
+        {"go": _go_env(repo_path), "flags": flags, "data": data.hexdigest()}, sort_keys=True
+    ).encode()
+
+    keys = {}
+    for name, entry in graph.items():
+        if not entry["root"]:
+            continue
+        h = hashlib.sha256(common)
+        for dep in sorted(_closure(graph, name)):
+            directory = graph[dep]["dir"]
+            h.update(f"\n{dep}\0{directory}\0".encode())
+            h.update("\n".join(sources.get(directory, [])).encode())
+        keys[name] = h.hexdigest()
+    return keys, graph
+
+
+def pattern_packages(pattern: str, graph: dict[str, dict]) -> list[str]:
+    """Root packages of the graph a relative pattern ("./dir", "./dir/...", ".") matches."""
+    rel = "" if pattern == "." else pattern.removeprefix("./")
+    recursive = rel == "..." or rel.endswith("/...")
+    if recursive:
+        rel = rel[: -len("...")].rstrip("/")
+    matched = []
+    for name, entry in graph.items():
+        if not entry["root"]:
+            continue
+        directory = entry["dir"]
+        if directory == rel or (recursive and (not rel or directory.startswith(rel + "/"))):
+            matched.append(name)
+    return sorted(matched)
+
+
+class ResultCache:
+    """
+    Package test results, one JSON file per key, kept where the agent cannot
+    reach them.
+
+    Like the go command's own test cache, only results that passed (or had no
+    tests to run) are stored, so a flaky failure is always retried. The least
+    recently used entries beyond `max_entries` are evicted.
+    """
+
+    def __init__(self, root: str | None = None, max_entries: int | None = None):
+        self.root = Path(root or os.environ.get("RESULT_CACHE_DIR", "/evaluation/result_cache"))
+        if max_entries is None:
+            max_entries = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES))
+        self.max_entries = max_entries
+
+    def _path(self, key: str) -> Path:
+        return self.root / f"{key}.json"
+
+    def get(self, key: str) -> dict | None:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                record = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return record
+
+    def put(self, key: str, record: dict):
+        atomic_write_json(self._path(key), record)
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for entry in os.scandir(self.root):
+            if entry.name.endswith(".json") and not entry.name.startswith("."):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort()
+        for _, path in entries[: len(entries) - self.max_entries]:
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
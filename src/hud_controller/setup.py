@@ -3,9 +3,19 @@ import logging
 import os
 import subprocess
 import shutil
+import tempfile
+import weakref
 from pathlib import Path
 from typing import Any
 
+from . import async_proc
+from .git_baseline import COMMIT_MESSAGE, install_baseline
+from .go_modules import FingerprintStore
+from .setup_metrics import phase, setup_record
+from .trash import default_trash
+from .tree_cache import default_tree_cache
+from .workspace import WorkspaceState, agent_ids, as_agent, reset_workspace, snapshot
+
 try:
     from .manual_dinit import ServiceLoader, SimpleDinit
 except ImportError:
@@ -14,6 +24,8 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+_slots: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
 def subprocess_run(cmd, cwd=None, check=True, shell=False):
     """Helper to run shell commands with logging."""
     try:
@@ -48,9 +60,123 @@ async def start_dinit():
     else:
         logger.info("No services found to start.")
 
-def setup_codebase(base: str, test: str, golden: str):
-    repo_path = os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+async def archive_into(secure_git: str, rev: str, dest: str, paths: tuple[str, ...] = ()) -> int | None:
+    """
+    Stream `git archive rev -- paths` straight into dest in a single pass.
+
+    tar runs as the agent user (after chdir-ing into dest as root), so files are
+    created with their final ownership, and skips nested .git entries as they
+    stream by. Returns the number of files written, or None if either side of
+    the pipe failed.
+    """
+    archive_cmd = ["git", f"--git-dir={secure_git}", "archive", rev]
+    if paths:
+        archive_cmd += ["--", *paths]
+    archive_rc, tar_rc, tar_out, stderr = await async_proc.run_pipe(
+        archive_cmd,
+        ["tar", "-x", "-v", "-p", "--exclude=.git", "-f", "-"],
+        consumer_kwargs={"cwd": dest, **as_agent()},
+    )
+
+    if archive_rc != 0 or tar_rc != 0:
+        logger.debug(f"Archive of {rev[:8]} {' '.join(paths)} failed: {stderr.decode(errors='replace')}")
+        return None
+    return sum(1 for line in tar_out.splitlines() if not line.endswith(b"/"))
+
+async def compose_tree(secure_git: str, base: str, golden: str) -> str:
+    """
+    Return the id of a tree holding base with golden's test/ laid over it.
+
+    The tree is assembled in a throwaway index against the secure repo, so no
+    working tree is involved and only the new tree objects are written. Like
+    extracting golden's test/ over base, files that exist only in base's
+    test/ are kept.
+    """
+    if not golden:
+        return base
+    with tempfile.TemporaryDirectory(prefix="compose-") as tmp:
+        env = {**os.environ, "GIT_DIR": secure_git, "GIT_INDEX_FILE": os.path.join(tmp, "index")}
+        await async_proc.run("git", "read-tree", base, env=env)
+        ls_rc, update_rc, _, stderr = await async_proc.run_pipe(
+            ["git", f"--git-dir={secure_git}", "ls-tree", "-r", "-z", golden, "--", "test/"],
+            ["git", "update-index", "-z", "--index-info"],
+            consumer_kwargs={"env": env},
+        )
+        if ls_rc != 0 or update_rc != 0:
+            raise RuntimeError(
+                f"Failed to overlay test/ from {golden[:8]}: {stderr.decode(errors='replace')}"
+            )
+        _, stdout, _ = await async_proc.run("git", "write-tree", env=env)
+    return stdout.decode().strip()
+
+async def extract_tree(secure_git: str, base: str, golden: str, dest: str):
+    """Extract the base tree with golden test/ overlaid, owned by the agent user."""
+    if os.geteuid() == 0:
+        os.chown(dest, *agent_ids())
+
+    if golden:
+        logger.info(f"Composing buggy commit {base[:8]} with tests from golden commit {golden[:8]}...")
+    with phase("compose"):
+        tree = await compose_tree(secure_git, base, golden)
+
+    logger.info(f"Extracting source at buggy commit {base[:8]}...")
+    with phase("archive") as metrics:
+        files = await archive_into(secure_git, tree, dest)
+        if files is None:
+            raise RuntimeError(f"Failed to extract {base[:8]} from {secure_git}")
+        metrics["files"] = files
+
+async def clean_workspace(repo_path: str) -> int:
+    """Empty repo_path by moving its contents to the trash; returns the entries moved."""
+    logger.info("Cleaning workspace...")
+    if not os.path.exists(repo_path):
+        os.makedirs(repo_path, exist_ok=True)
+        return 0
+    trash = default_trash()
+    if trash.over_cap:
+        await asyncio.to_thread(trash.wait_for_room)
+    return trash.discard_contents(repo_path)
+
+async def init_agent_repo(repo_path: str):
+    """Replace any existing .git with a fresh single-commit repo."""
+    logger.info("Initializing clean git repo for agent...")
+    
+    await asyncio.to_thread(shutil.rmtree, os.path.join(repo_path, ".git"), ignore_errors=True)
+    await async_proc.run("git", "init", cwd=repo_path)
+    await async_proc.run("git", "add", ".", cwd=repo_path)
+    await async_proc.run("git", "commit", "-m", COMMIT_MESSAGE, cwd=repo_path)
+
+def forget_module_fingerprint(repo_path: str):
+    """
+    Drop the workspace's module fingerprint. A fresh setup is not known to be
+    tidy (golden's test/ may add imports base never vendored), so the first
+    grading runs go mod tidy/vendor and records the fingerprint itself.
+    """
+    FingerprintStore().clear(repo_path)
+
+def _setup_slots() -> asyncio.Semaphore:
+    """Per-event-loop limit on setups running at once (SETUP_CONCURRENCY)."""
+    loop = asyncio.get_running_loop()
+    slots = _slots.get(loop)
+    if slots is None:
+        slots = _slots[loop] = asyncio.Semaphore(max(1, int(os.environ.get("SETUP_CONCURRENCY", "4"))))
+    return slots
+
+async def setup_codebase(base: str, test: str, golden: str, repo_path: str | None = None) -> dict[str, Any]:
+    """
+    Prepare the agent workspace and return the setup's phase metrics.
+
+    Waits for one of SETUP_CONCURRENCY slots first. Cancelling the caller
+    kills whatever child processes the setup is running.
+    """
+    async with _setup_slots():
+        return await _setup_codebase(base, test, golden, repo_path)
+
+async def _setup_codebase(base: str, test: str, golden: str, repo_path: str | None) -> dict[str, Any]:
+    repo_path = repo_path or os.environ.get("REPO_PATH", "/home/ubuntu/repo")
     secure_git = os.environ.get("SECURE_GIT_DIR", "/evaluation/secure_git/repo.git")
+    # "prebuilt" installs the cached baseline commit; "fresh" runs git init/add/commit.
+    git_mode = os.environ.get("AGENT_GIT_MODE", "prebuilt")
     
     logger.info("=" * 50)
     logger.info(f"SETTING UP GO TASK")
@@ -58,58 +184,96 @@ def setup_codebase(base: str, test: str, golden: str):
     logger.info(f"   Golden commit: {golden[:8] if golden else 'N/A'}")
     logger.info("=" * 50)
     
-    try:
-        logger.info("Cleaning workspace...")
-        if os.path.exists(repo_path):
-            subprocess_run(f"rm -rf {repo_path}/*", shell=True)
-            subprocess_run(f"rm -rf {repo_path}/.* 2>/dev/null || true", shell=True)
-        else:
-            os.makedirs(repo_path, exist_ok=True)
-
-        logger.info(f"Extracting source at buggy commit {base[:8]}...")
-        
-        archive_cmd = f"git --git-dir={secure_git} archive {base} | tar -x -C {repo_path}"
-        subprocess_run(archive_cmd, shell=True)
-        
-        if golden:
-            logger.info(f"Injecting tests from golden commit {golden[:8]}...")
-            test_archive_cmd = (
-                f"git --git-dir={secure_git} archive {golden} -- test/ 2>/dev/null | "
-                f"tar -x -C {repo_path} 2>/dev/null || true"
-            )
-            subprocess_run(test_archive_cmd, shell=True)
-        
-        logger.info("Initializing clean git repo for agent...")
-        
-        for item in Path(repo_path).rglob('.git'):
-            if item.is_dir():
-                shutil.rmtree(item)
-            elif item.is_file():
-                item.unlink()
-        
-        subprocess_run(["git", "init"], cwd=repo_path)
-        subprocess_run(["git", "add", "."], cwd=repo_path)
-        subprocess_run(
-            ["git", "commit", "-m", "Initial state (contains bug to fix)"],
-            cwd=repo_path
-        )
-        
-        subprocess_run(["chown", "-R", "ubuntu:ubuntu", repo_path])
+    with setup_record(base=base, golden=golden, repo_path=repo_path) as record:
+        try:
+            forget_module_fingerprint(repo_path)
+            tree_cache = default_tree_cache()
+            if not tree_cache.enabled:
+                record["mode"] = "extract"
+                with phase("clean") as metrics:
+                    metrics["files"] = await clean_workspace(repo_path)
+                await extract_tree(secure_git, base, golden, repo_path)
+                with phase("git"):
+                    await init_agent_repo(repo_path)
+                with phase("chown"):
+                    await async_proc.run("chown", "-R", "ubuntu:ubuntu", os.path.join(repo_path, ".git"))
+            else:
+                key = tree_cache.key(base, golden)
+                record["tree_cache_hit"] = bool(tree_cache.meta(key))
+                build = lambda dest: extract_tree(secure_git, base, golden, str(dest))
+                async with tree_cache.checkout(base, golden, build) as tree:
+                    state = WorkspaceState(tree_cache, repo_path)
+                    previous = state.load() if os.path.isdir(repo_path) else None
+                    state.clear()
+
+                    if previous is not None:
+                        logger.info("Resetting workspace incrementally...")
+                        record["mode"] = "incremental"
+                        with phase("reset") as metrics:
+                            manifest, prev_manifest = await asyncio.gather(
+                                asyncio.to_thread(tree_cache.manifest, key),
+                                asyncio.to_thread(tree_cache.manifest, previous["key"]),
+                            )
+                            stats, counts = await asyncio.to_thread(
+                                reset_workspace,
+                                repo_path,
+                                tree,
+                                manifest,
+                                prev_manifest,
+                                previous["stats"],
+                            )
+                            metrics["files"] = counts["restored"] + counts["removed"]
+                        logger.info(
+                            f"   restored {counts['restored']}, removed {counts['removed']}, "
+                            f"hashed {counts['hashed']}, unchanged {counts['unchanged']}"
+                        )
+                    else:
+                        with phase("clean") as metrics:
+                            metrics["files"] = await clean_workspace(repo_path)
+                        logger.info("Materializing cached source tree...")
+                        record["mode"] = "materialize"
+                        with phase("materialize") as metrics:
+                            # Cached trees are already owned by the agent user.
+                            await tree_cache.materialize(tree, repo_path)
+                            if os.geteuid() == 0:
+                                os.chown(repo_path, *agent_ids())
+                            metrics["files"] = tree_cache.meta(key).get("file_count", 0)
+                        with phase("snapshot") as metrics:
+                            stats = await asyncio.to_thread(snapshot, repo_path)
+                            metrics["files"] = len(stats)
+
+                    with phase("git") as metrics:
+                        if git_mode == "prebuilt":
+                            logger.info("Installing prebuilt baseline commit for agent...")
+                            baseline = await tree_cache.baseline(key)
+                            metrics["files"] = await install_baseline(repo_path, baseline)
+                        else:
+                            await init_agent_repo(repo_path)
+                    with phase("chown"):
+                        await async_proc.run("chown", "-R", "ubuntu:ubuntu", os.path.join(repo_path, ".git"))
+
+                    state.save(key, stats)
+
         
-        logger.info("=" * 50)
-        logger.info("SETUP COMPLETE")
-        logger.info("=" * 50)
-        logger.info(f"   Workspace: {repo_path}")
-        logger.info("   ")
-        logger.info("   Agent instructions:")
-        logger.info("   • Read tests in *_test.go files to understand expected behavior")
-        logger.info("   • Modify source files to fix the bug")
-        logger.info("   • Call evaluate() when done")
-        logger.info("   • DO NOT run go test manually (use evaluate)")
+            logger.info("=" * 50)
+            logger.info("SETUP COMPLETE")
+            logger.info("=" * 50)
+            logger.info(f"   Workspace: {repo_path}")
+            logger.info("   ")
+            logger.info("   Agent instructions:")
+            logger.info("   • Read tests in *_test.go files to understand expected behavior")
+            logger.info("   • Modify source files to fix the bug")
+            logger.info("   • Call evaluate() when done")
+            logger.info("   • DO NOT run go test manually (use evaluate)")
         
-    except Exception as e:
-        logger.error(f"Setup failed: {e}")
-        raise
+        except asyncio.CancelledError:
+            logger.warning(f"Setup of {base[:8]} cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Setup failed: {e}")
+            raise
+
+    return record
 
 async def default_setup(template: dict[str, Any]) -> None:
     """Default setup function that initializes the environment for coding tasks."""
@@ -118,8 +282,7 @@ async def default_setup(template: dict[str, Any]) -> None:
 
     await start_dinit()
 
-    await asyncio.to_thread(
-        setup_codebase,
+    await setup_codebase(
         base=template["base"],
         test=template["test"],
         golden=template["golden"],
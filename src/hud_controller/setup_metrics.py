@@ -0,0 +1,113 @@
+import contextvars
+import logging
+import resource
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+MAX_RECENT = 50
+
+_current: contextvars.ContextVar[dict | None] = contextvars.ContextVar("setup_record", default=None)
+
+_lock = threading.Lock()
+_recent: deque[dict] = deque(maxlen=MAX_RECENT)
+_phases: dict[str, dict[str, float]] = {}
+_setups = 0
+
+
+def _usage() -> tuple[float, int]:
+    """(CPU seconds, 512-byte blocks written) for this process plus reaped children.
+
+    Setups share the event loop and its worker threads, so usage is accounted
+    process-wide: phases of setups running concurrently bleed into each
+    other's CPU and I/O.
+    """
+    me = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = me.ru_utime + me.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, me.ru_oublock + children.ru_oublock
+
+
+@contextmanager
+def phase(name: str) -> Iterator[dict[str, Any]]:
+    """
+    Measure one setup phase and attach it to the current setup record.
+
+    Yields the phase's metrics dict so the phase can fill in `files` (how many
+    files it created, rewrote or removed). Bytes written are block-layer
+    writes, so data still sitting in the page cache is not counted.
+    """
+    metrics: dict[str, Any] = {"name": name, "files": 0}
+    wall_start = time.perf_counter()
+    cpu_start, blocks_start = _usage()
+    try:
+        yield metrics
+    finally:
+        cpu_end, blocks_end = _usage()
+        metrics["wall"] = time.perf_counter() - wall_start
+        metrics["cpu"] = cpu_end - cpu_start
+        metrics["bytes_written"] = (blocks_end - blocks_start) * 512
+        logger.info(
+            f"   [{name}] {metrics['wall']:.3f}s wall, {metrics['cpu']:.3f}s cpu, "
+            f"{metrics['bytes_written']} bytes, {metrics['files']} files"
+        )
+        record = _current.get()
+        if record is not None:
+            record["phases"].append(metrics)
+
+
+@contextmanager
+def setup_record(**info: Any) -> Iterator[dict[str, Any]]:
+    """Collect the phases of one setup call and fold them into the aggregates."""
+    record: dict[str, Any] = {**info, "phases": [], "started_at": time.time()}
+    token = _current.set(record)
+    wall_start = time.perf_counter()
+    try:
+        yield record
+        record["ok"] = True
+    except BaseException:
+        record["ok"] = False
+        raise
+    finally:
+        _current.reset(token)
+        record["wall"] = time.perf_counter() - wall_start
+        _finish(record)
+
+
+def _finish(record: dict[str, Any]):
+    global _setups
+    with _lock:
+        _setups += 1
+        _recent.append(record)
+        for p in record["phases"]:
+            agg = _phases.setdefault(
+                p["name"],
+                {"count": 0, "wall_total": 0.0, "wall_max": 0.0, "cpu_total": 0.0,
+                 "bytes_written_total": 0, "files_total": 0},
+            )
+            agg["count"] += 1
+            agg["wall_total"] += p["wall"]
+            agg["wall_max"] = max(agg["wall_max"], p["wall"])
+            agg["cpu_total"] += p["cpu"]
+            agg["bytes_written_total"] += p["bytes_written"]
+            agg["files_total"] += p["files"]
+
+
+def summary() -> dict[str, Any]:
+    """Aggregated per-phase metrics across setups plus the most recent records."""
+    with _lock:
+        phases = {
+            name: {**agg, "wall_mean": agg["wall_total"] / agg["count"]}
+            for name, agg in _phases.items()
+        }
+        return {
+            "setups": _setups,
+            "phases": phases,
+            "last": _recent[-1] if _recent else None,
+            "recent": list(_recent),
+        }
@@ -93,9 +93,12 @@ class Grade:
 class EnvironmentState:
     """The state of the environment at the time of grading."""
 
-    def __init__(self):
+    def __init__(self, config: dict[str, Any] | None = None, problem_id: str | None = None):
         """Initialize the environment state without database functionality."""
         logger.info("Initializing EnvironmentState without database")
+        # The task's ProblemSpec.config and id, for graders with per-task settings.
+        self.config = config or {}
+        self.problem_id = problem_id
 
     @classmethod
     def from_sqlite(cls, sqlite_path: str) -> "EnvironmentState":
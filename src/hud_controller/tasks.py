@@ -0,0 +1,24 @@
+import functools
+import json
+import os
+from pathlib import Path
+
+
+def tasks_path() -> Path:
+    """Location of hud_tasks.json (the source the problem registry is generated from)."""
+    default = Path(__file__).resolve().parents[2] / "hud_tasks.json"
+    return Path(os.environ.get("HUD_TASKS_PATH", default))
+
+
+@functools.cache
+def load_tasks() -> dict[str, dict]:
+    """Return hud_tasks.json entries keyed by task id, or {} if it is missing."""
+    try:
+        with open(tasks_path()) as f:
+            return {task["task_id"]: task for task in json.load(f)}
+    except FileNotFoundError:
+        return {}
+
+
+def task_files(problem_id: str) -> list[str]:
+    return load_tasks().get(problem_id, {}).get("files", [])
@@ -0,0 +1,112 @@
+import functools
+import json
+import logging
+import os
+import re
+import subprocess
+from pathlib import Path
+
+import click
+
+from .tasks import load_tasks
+from .utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+# Top-level test functions: TestXxx where Xxx does not start with a lowercase letter.
+_TEST_FUNC = re.compile(r"^func\s+(Test(?![a-z])\w*)\s*\(\s*\w+\s+\*testing\.T\s*\)", re.MULTILINE)
+
+
+def test_names(source: str) -> list[str]:
+    """Names of the top-level Go test functions declared in source."""
+    return sorted(set(_TEST_FUNC.findall(source)))
+
+
+def run_filter(names: list[str]) -> str:
+    """
+    Anchored `go test -run` regex selecting exactly these top-level tests (and
+    their subtests); names are matched literally. No names selects nothing.
+    """
+    if not names:
+        return "^$"
+    return "^(" + "|".join(re.escape(name) for name in names) + ")$"
+
+
+def compute_focus(secure_git: str, golden: str, files: list[str]) -> dict[str, list[str]]:
+    """
+    Test functions of the task's _test.go files as of the golden commit.
+
+    Returns {package pattern ("./dir" or "."): sorted test names}; packages
+    whose listed test files declare no tests (or do not exist at golden) are
+    left out.
+    """
+    focus: dict[str, set[str]] = {}
+    for path in files:
+        if not path.endswith("_test.go"):
+            continue
+        result = subprocess.run(
+            ["git", "--git-dir", secure_git, "show", f"{golden}:{path}"],
+            capture_output=True,
+            text=True,
+            errors="replace",
+        )
+        if result.returncode != 0:
+            logger.info(f"{path} does not exist at {golden[:12]}, not focusing on it")
+            continue
+        names = test_names(result.stdout)
+        if names:
+            directory = os.path.dirname(path)
+            focus.setdefault(f"./{directory}" if directory else ".", set()).update(names)
+    return {pattern: sorted(names) for pattern, names in sorted(focus.items())}
+
+
+def focus_path() -> Path:
+    """
+    Location of the precomputed per-task focus. It names tests from the
+    golden commit's hidden test files, so it lives in a root-only directory.
+    """
+    return Path(os.environ.get("TEST_FOCUS_PATH", "/evaluation/test_focus/test_focus.json"))
+
+
+@functools.cache
+def load_focus() -> dict[str, dict]:
+    """Precomputed focus keyed by task id, or {} if it was never generated."""
+    try:
+        with open(focus_path()) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def focus_for(problem_id: str | None, golden: str, files: list[str], secure_git: str) -> tuple[dict[str, list[str]], str]:
+    """
+    The task's focus and where it came from ("precomputed" or "computed").
+
+    The precomputed entry is only used if it was generated for the same
+    golden commit; otherwise the test files are parsed on the spot.
+    """
+    entry = load_focus().get(problem_id or "")
+    if entry is not None and entry.get("golden") == golden:
+        return entry["packages"], "precomputed"
+    return compute_focus(secure_git, golden, files), "computed"
+
+
+@click.command()
+@click.option("--task", "task_ids", multiple=True, help="Task id to compute (default: all tasks)")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="Output file (default: TEST_FOCUS_PATH)")
+def main(task_ids: tuple[str, ...], output: str | None):
+    """Precompute each task's focused test selection from its golden commit."""
+    logging.basicConfig(level=logging.INFO)
+    secure_git = os.environ.get("SECURE_GIT_DIR", "/evaluation/secure_git/repo.git")
+    output_path = Path(output) if output else focus_path()
+    tasks = load_tasks()
+    focus = dict(load_focus()) if task_ids else {}
+    for task_id in task_ids or tasks:
+        task = tasks[task_id]
+        packages = compute_focus(secure_git, task["golden_commit"], task["files"])
+        focus[task_id] = {"golden": task["golden_commit"], "packages": packages}
+        tests = sum(len(names) for names in packages.values())
+        logger.info(f"{task_id}: {tests} tests in {len(packages)} packages")
+
+    atomic_write_json(output_path, focus, private=not output, indent=2, sort_keys=True)
+    click.echo(f"Wrote focus for {len(focus)} tasks to {output_path}")
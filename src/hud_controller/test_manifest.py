@@ -0,0 +1,259 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import click
+
+from .tasks import load_tasks
+from .tree_cache import walk_files
+from .utils import atomic_write_json, available_cpus
+from .workspace import agent_ids
+
+logger = logging.getLogger(__name__)
+
+TEST_PREFIX = "test/"
+# Paths per `git archive` call when restoring, to stay well under ARG_MAX.
+RESTORE_BATCH = 500
+
+
+def git_blob_hash(path: str, st: os.stat_result) -> str:
+    """The object id git would give this file or symlink as a blob."""
+    if stat.S_ISLNK(st.st_mode):
+        data = os.fsencode(os.readlink(path))
+        return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+    h = hashlib.sha1(b"blob %d\0" % st.st_size)
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _git_mode(st: os.stat_result) -> str:
+    if stat.S_ISLNK(st.st_mode):
+        return "120000"
+    # Git records a file as executable by its owner execute bit alone.
+    return "100755" if st.st_mode & 0o100 else "100644"
+
+
+def _ls_tree(secure_git: str, commit: str, prefix: str) -> dict[str, list[str]] | None:
+    result = subprocess.run(
+        ["git", "--git-dir", secure_git, "ls-tree", "-r", "-z", "--full-tree", commit, "--", prefix],
+        capture_output=True,
+    )
+    if result.returncode != 0:
+        return None
+    files = {}
+    for record in result.stdout.split(b"\0"):
+        if not record:
+            continue
+        info, path = record.split(b"\t", 1)
+        mode, kind, oid = info.decode().split()
+        if kind == "blob":
+            files[os.fsdecode(path)] = [oid, mode]
+    return files
+
+
+def build_manifest(secure_git: str, golden: str, base: str | None = None, prefix: str = TEST_PREFIX) -> dict[str, list[str]] | None:
+    """
+    {path: [blob id, git mode]} for every file under prefix in the tree the
+    workspace is set up from: base with golden's files laid over it, as
+    setup.compose_tree builds it, so files only base has are expected too.
+    Without base, golden's files alone. Read from the tree objects without
+    checking anything out; None if a commit is not in the repository.
+    """
+    manifest = {}
+    if base:
+        files = _ls_tree(secure_git, base, prefix)
+        if files is None:
+            return None
+        manifest.update(files)
+    files = _ls_tree(secure_git, golden, prefix)
+    if files is None:
+        return None
+    manifest.update(files)
+    return manifest
+
+
+def paths_at(secure_git: str, commit: str, paths: list[str]) -> list[str]:
+    """The paths that are files at the commit, in git's order."""
+    found = []
+    for start in range(0, len(paths), RESTORE_BATCH):
+        result = subprocess.run(
+            [
+                "git", "--git-dir", secure_git, "ls-tree", "-z", "--name-only", "--full-tree", commit,
+                "--", *paths[start : start + RESTORE_BATCH],
+            ],
+            capture_output=True,
+        )
+        if result.returncode != 0:
+            return []
+        found.extend(os.fsdecode(path) for path in result.stdout.split(b"\0") if path)
+    return found
+
+
+class TestManifestStore:
+    """Precomputed test/ manifests, one JSON file per (base, golden) pair."""
+
+    def __init__(self, root: str | None = None):
+        self.root = Path(root or os.environ.get("TEST_MANIFEST_DIR", "/evaluation/test_manifests"))
+
+    def _path(self, golden: str, base: str | None) -> Path:
+        return self.root / (f"{base}-{golden}.json" if base else f"{golden}.json")
+
+    def load(self, golden: str, base: str | None = None) -> dict[str, list[str]] | None:
+        try:
+            with open(self._path(golden, base)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def get(self, secure_git: str, golden: str, base: str | None = None) -> tuple[dict[str, list[str]] | None, str]:
+        """The composed tree's manifest and where it came from ("precomputed" or "computed")."""
+        manifest = self.load(golden, base)
+        if manifest is not None:
+            return manifest, "precomputed"
+        manifest = build_manifest(secure_git, golden, base)
+        if manifest is not None:
+            self.save(golden, manifest, base)
+        return manifest, "computed"
+
+    def save(self, golden: str, manifest: dict[str, list[str]], base: str | None = None):
+        atomic_write_json(self._path(golden, base), manifest)
+
+
+def verify(repo_path: str, manifest: dict[str, list[str]], prefix: str = TEST_PREFIX) -> dict[str, list[str]]:
+    """
+    Compare the workspace's files under prefix with the manifest.
+
+    Files are hashed in parallel. Returns {"missing", "modified", "added"},
+    each a sorted list of paths; a directory the agent replaced with a
+    symlink makes the files below it missing.
+    """
+    present = {}
+    top = os.path.join(repo_path, prefix)
+    if os.path.isdir(top) and not os.path.islink(top.rstrip("/")):
+        for rel, st in walk_files(top):
+            present[prefix + rel] = st
+
+    def check(rel: str) -> bool:
+        st = present[rel]
+        oid, mode = manifest[rel]
+        if not (stat.S_ISREG(st.st_mode) or stat.S_ISLNK(st.st_mode)) or _git_mode(st) != mode:
+            return False
+        try:
+            return git_blob_hash(os.path.join(repo_path, rel), st) == oid
+        except OSError:
+            return False
+
+    expected = sorted(rel for rel in manifest if rel in present)
+    with ThreadPoolExecutor(max_workers=available_cpus()) as pool:
+        modified = [rel for rel, ok in zip(expected, pool.map(check, expected)) if not ok]
+    return {
+        "missing": sorted(rel for rel in manifest if rel not in present),
+        "modified": modified,
+        "added": sorted(rel for rel in present if rel not in manifest),
+    }
+
+
+def restore(repo_path: str, secure_git: str, golden: str, paths: list[str]):
+    """
+    Extract paths from the golden commit over the workspace, owned by the
+    agent user along with any directories the extraction creates.
+    """
+    created = set()
+    for rel in paths:
+        # Never extract through a directory the agent swapped for a symlink
+        # or a file. Outermost first, so directories below a removed one are
+        # known to be created too.
+        parents = []
+        parent = os.path.dirname(rel)
+        while parent:
+            parents.append(parent)
+            parent = os.path.dirname(parent)
+        for parent in reversed(parents):
+            full = os.path.join(repo_path, parent)
+            if os.path.islink(full) or (os.path.lexists(full) and not os.path.isdir(full)):
+                os.unlink(full)
+            if not os.path.lexists(full):
+                created.add(parent)
+        full = os.path.join(repo_path, rel)
+        if os.path.isdir(full) and not os.path.islink(full):
+            shutil.rmtree(full)
+
+    for start in range(0, len(paths), RESTORE_BATCH):
+        batch = paths[start : start + RESTORE_BATCH]
+        archive = subprocess.Popen(
+            ["git", "--git-dir", secure_git, "archive", golden, "--", *batch], stdout=subprocess.PIPE
+        )
+        # Directories that already exist keep their owner and mode.
+        subprocess.run(
+            ["tar", "-x", "--no-overwrite-dir", "-C", repo_path], stdin=archive.stdout, check=True, capture_output=True
+        )
+        archive.stdout.close()
+        if archive.wait() != 0:
+            raise subprocess.CalledProcessError(archive.returncode, archive.args)
+
+    if os.geteuid() == 0:
+        uid, gid = agent_ids()
+        for rel in [*created, *paths]:
+            os.lchown(os.path.join(repo_path, rel), uid, gid)
+
+
+def enforce(
+    repo_path: str, secure_git: str, golden: str, base: str | None = None, store: TestManifestStore | None = None
+) -> dict | None:
+    """
+    Make the workspace's test/ match the tree it was set up from (see
+    build_manifest).
+
+    Only missing and modified files are restored. Files in neither commit's
+    test/ are removed, or only reported when TEST_INTEGRITY_ADDED is "flag".
+    Returns the report for grade metadata, or None if no manifest could be
+    had for the commits.
+    """
+    manifest, source = (store or TestManifestStore()).get(secure_git, golden, base)
+    if manifest is None:
+        return None
+    report = verify(repo_path, manifest)
+    # Added paths go first: one of them may be a symlink standing in for a
+    # directory the restore has to recreate.
+    remove_added = os.environ.get("TEST_INTEGRITY_ADDED", "remove") != "flag"
+    if remove_added:
+        for rel in report["added"]:
+            try:
+                os.unlink(os.path.join(repo_path, rel))
+            except FileNotFoundError:
+                pass
+    restored = report["missing"] + report["modified"]
+    if restored:
+        # Golden's files win in the composed tree; the rest come from base.
+        at_golden = set(paths_at(secure_git, golden, restored))
+        restore(repo_path, secure_git, golden, [rel for rel in restored if rel in at_golden])
+        if base:
+            restore(repo_path, secure_git, base, [rel for rel in restored if rel not in at_golden])
+    return {"manifest": source, "checked": len(manifest), **report, "added_removed": remove_added}
+
+
+@click.command()
+@click.option("--task", "task_ids", multiple=True, help="Task id to compute (default: all tasks)")
+def main(task_ids: tuple[str, ...]):
+    """Precompute the test/ manifest of each task's buggy commit with golden's test/ laid over it."""
+    logging.basicConfig(level=logging.INFO)
+    secure_git = os.environ.get("SECURE_GIT_DIR", "/evaluation/secure_git/repo.git")
+    store = TestManifestStore()
+    tasks = load_tasks()
+    for task_id in task_ids or tasks:
+        base, golden = tasks[task_id]["buggy_commit"], tasks[task_id]["golden_commit"]
+        manifest = build_manifest(secure_git, golden, base)
+        if manifest is None:
+            logger.warning(f"{task_id}: commit {base[:12]} or {golden[:12]} not found")
+            continue
+        store.save(golden, manifest, base)
+        logger.info(f"{task_id}: {len(manifest)} files under {TEST_PREFIX}")
+    click.echo(f"Wrote test manifests to {store.root}")
@@ -0,0 +1,181 @@
+import functools
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .tree_cache import tree_size
+from .utils import private_dir
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+
+
+class Trash:
+    """
+    Rename-and-reap deletion of old workspaces.
+
+    Discarded paths are renamed into a root-only trash directory, which is
+    instant, and a background reaper thread deletes them with idle I/O and CPU
+    priority. Renames only work within one filesystem, so the trash defaults to
+    a directory next to the agent's home (/home/.trash for the default
+    REPO_PATH), which the agent cannot write to; anything on another
+    filesystem is deleted in the foreground instead. The reaper runs as root,
+    so it only starts on a trash directory that passes utils.private_dir.
+
+    `max_bytes` bounds the measured backlog: callers about to discard more
+    should first wait in `wait_for_room` until the reaper has caught up.
+    """
+
+    def __init__(self, root: str | None = None, max_bytes: int | None = None):
+        repo_path = os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+        self.root = Path(
+            root
+            or os.environ.get("TRASH_DIR")
+            or os.path.join(os.path.dirname(os.path.dirname(repo_path.rstrip("/"))), ".trash")
+        )
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("TRASH_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+
+        self._cond = threading.Condition()
+        self._unmeasured: list[Path] = []
+        self._pending: dict[Path, int] = {}
+        self._backlog_bytes = 0
+        self._thread: threading.Thread | None = None
+
+        self.reaped = 0
+        self.reaped_bytes = 0
+        self.reap_seconds = 0.0
+        self.foreground = 0
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            private_dir(self.root)
+            # Pick up whatever an earlier process left behind.
+            self._unmeasured.extend(
+                p for p in self.root.iterdir() if p not in self._pending and p not in self._unmeasured
+            )
+            self._thread = threading.Thread(target=self._run, name="trash-reaper", daemon=True)
+            self._thread.start()
+
+    @property
+    def over_cap(self) -> bool:
+        return self.max_bytes > 0 and self._backlog_bytes > self.max_bytes
+
+    def wait_for_room(self):
+        """Block until the reaper has brought the backlog under max_bytes."""
+        with self._cond:
+            if not self.over_cap:
+                return
+            logger.info(f"Trash backlog {self._backlog_bytes} bytes over cap, waiting for reaper...")
+            start = time.time()
+            self._cond.wait_for(lambda: not self.over_cap)
+            self.waits += 1
+            self.wait_seconds += time.time() - start
+
+    def discard(self, path: str | Path) -> bool:
+        """Move path into the trash. Returns False if it had to be deleted in place."""
+        return self._discard_entries([Path(path)])
+
+    def discard_contents(self, path: str | Path) -> int:
+        """Empty directory path (keeping the directory itself) and return the number of entries moved."""
+        entries = [Path(entry.path) for entry in os.scandir(path)]
+        if entries:
+            self._discard_entries(entries)
+        return len(entries)
+
+    def _delete_in_place(self, paths: list[Path]):
+        self.foreground += 1
+        for p in paths:
+            if os.path.lexists(p):
+                subprocess.run(["rm", "-rf", "--", str(p)], check=False)
+
+    def _discard_entries(self, paths: list[Path]) -> bool:
+        try:
+            with self._cond:
+                self._ensure_started()
+        except PermissionError as e:
+            logger.error(f"Not using trash directory {self.root} ({e}), deleting in place")
+            self._delete_in_place(paths)
+            return False
+        bucket = self.root / f"{time.time_ns()}-{uuid.uuid4().hex[:8]}"
+        bucket.mkdir()
+        try:
+            for path in paths:
+                os.rename(path, bucket / path.name)
+        except OSError as e:
+            logger.warning(f"Cannot move {path} into trash ({e}), deleting in place")
+            self._delete_in_place(paths)
+            moved = False
+        else:
+            moved = True
+        with self._cond:
+            self._unmeasured.append(bucket)
+            self._cond.notify_all()
+        return moved
+
+    def _run(self):
+        try:
+            # Linux applies niceness per thread, so this only affects the reaper.
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except OSError:
+            pass
+        low_priority = ["ionice", "-c", "3", "nice", "-n", "19"] if shutil.which("ionice") else ["nice", "-n", "19"]
+
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._unmeasured or self._pending)
+                bucket = self._unmeasured.pop(0) if self._unmeasured else None
+
+            if bucket is not None:
+                # Measure everything queued before deleting anything, so the
+                # backlog (and backpressure) reflects the whole trash.
+                size_bytes = tree_size(bucket)[0] if bucket.exists() else 0
+                with self._cond:
+                    self._pending[bucket] = size_bytes
+                    self._backlog_bytes += size_bytes
+                    self._cond.notify_all()
+                continue
+
+            with self._cond:
+                bucket, size_bytes = next(iter(self._pending.items()))
+            start = time.time()
+            result = subprocess.run([*low_priority, "rm", "-rf", "--", str(bucket)], capture_output=True, text=True)
+            if result.returncode != 0:
+                logger.warning(f"Trash reaper failed on {bucket.name}: {result.stderr.strip()}")
+                shutil.rmtree(bucket, ignore_errors=True)
+            with self._cond:
+                del self._pending[bucket]
+                self._backlog_bytes -= size_bytes
+                self.reaped += 1
+                self.reaped_bytes += size_bytes
+                self.reap_seconds += time.time() - start
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "root": str(self.root),
+                "max_bytes": self.max_bytes,
+                "backlog_entries": len(self._pending) + len(self._unmeasured),
+                "backlog_bytes": self._backlog_bytes,
+                "reaped": self.reaped,
+                "reaped_bytes": self.reaped_bytes,
+                "reap_seconds": self.reap_seconds,
+                "foreground_deletes": self.foreground,
+                "backpressure_waits": self.waits,
+                "backpressure_seconds": self.wait_seconds,
+            }
+
+
+@functools.cache
+def default_trash() -> Trash:
+    return Trash()
@@ -0,0 +1,313 @@
+import asyncio
+import errno
+import functools
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import threading
+import time
+import uuid
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+
+from . import async_proc
+from .git_baseline import build_baseline
+from .utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+
+# Bumped whenever the layout or ownership of cached trees changes, so older
+# entries are rebuilt instead of materialized.
+CACHE_FORMAT = 4
+
+
+def tree_size(path: Path) -> tuple[int, int]:
+    """Return (bytes on disk, file count) for a directory tree."""
+    total_bytes = 0
+    file_count = 0
+    for dirpath, _dirnames, filenames in os.walk(path):
+        for name in filenames:
+            try:
+                st = os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            total_bytes += st.st_blocks * 512
+            file_count += 1
+    return total_bytes, file_count
+
+
+def hash_file(path: str, st: os.stat_result) -> str:
+    """Content digest for a regular file or symlink; OSError for anything else."""
+    h = hashlib.sha1()
+    if stat.S_ISLNK(st.st_mode):
+        h.update(b"link:" + os.fsencode(os.readlink(path)))
+        return h.hexdigest()
+    if not stat.S_ISREG(st.st_mode):
+        raise OSError(errno.EINVAL, "Not a regular file", path)
+    # Non-blocking and re-checked after the open: a FIFO swapped in after the
+    # lstat must not hang the reader.
+    fd = os.open(path, os.O_RDONLY | os.O_NOFOLLOW | os.O_NONBLOCK)
+    with open(fd, "rb") as f:
+        if not stat.S_ISREG(os.fstat(fd).st_mode):
+            raise OSError(errno.EINVAL, "Not a regular file", path)
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def walk_files(root: str | Path, skip: tuple[str, ...] = ()) -> Iterator[tuple[str, os.stat_result]]:
+    """Yield (relative path, lstat) for every file and symlink under root."""
+    root = str(root)
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        if rel_dir == ".":
+            rel_dir = ""
+            dirnames[:] = [d for d in dirnames if d not in skip]
+        for name in list(dirnames):
+            full = os.path.join(dirpath, name)
+            if os.path.islink(full):
+                dirnames.remove(name)
+                filenames.append(name)
+        for name in filenames:
+            full = os.path.join(dirpath, name)
+            try:
+                st = os.lstat(full)
+            except FileNotFoundError:
+                continue
+            yield os.path.join(rel_dir, name), st
+
+
+def build_manifest(tree: str | Path) -> dict[str, list]:
+    """Map every path in a tree to [sha1, size, st_mode]."""
+    manifest = {}
+    for rel, st in walk_files(tree):
+        manifest[rel] = [hash_file(os.path.join(tree, rel), st), st.st_size, st.st_mode]
+    return manifest
+
+
+class TreeCache:
+    """
+    On-disk cache of pristine source trees keyed by (base, golden) commit.
+
+    Each entry is a directory holding the fully prepared tree (base archive,
+    golden test/ overlay, nested .git entries stripped) plus a small metadata
+    file. Workspaces are materialized from an entry by reflink cloning
+    (falling back to a plain copy) instead of re-running `git archive`; files
+    are never hardlinked, since the agent's tools write files in place and
+    would rewrite the cached copy. Entries are evicted in least-recently-used
+    order to keep the cache under `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        root: str | None = None,
+        max_bytes: int | None = None,
+    ):
+        self.root = Path(root or os.environ.get("TREE_CACHE_DIR", "/evaluation/tree_cache"))
+        if max_bytes is None:
+            max_bytes = int(os.environ.get("TREE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self.max_bytes = max_bytes
+
+        self._lock = threading.Lock()
+        self._pins: dict[str, int] = {}
+        self._build_locks: dict[str, asyncio.Lock] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    @staticmethod
+    def key(base: str, golden: str | None) -> str:
+        return f"{base}-{golden}" if golden else base
+
+    def entry_path(self, key: str) -> Path:
+        return self.root / key
+
+    def _ensure_root(self):
+        self.root.mkdir(parents=True, exist_ok=True)
+        # The cache holds pristine trees for every task; keep the agent out.
+        os.chmod(self.root, 0o700)
+
+    def _touch(self, entry: Path):
+        (entry / "last_used").touch()
+
+    def _read_meta(self, entry: Path, any_format: bool = False) -> dict | None:
+        try:
+            with open(entry / "meta.json") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not any_format and meta.get("format") != CACHE_FORMAT:
+            return None
+        return meta
+
+    @asynccontextmanager
+    async def checkout(
+        self, base: str, golden: str | None, build: Callable[[Path], Awaitable[None]]
+    ) -> AsyncIterator[Path]:
+        """
+        Yield the cached tree for (base, golden), building it on a miss.
+
+        Concurrent checkouts of a missing entry wait for a single build. The
+        entry is pinned for the duration of the context so that eviction
+        triggered by another build cannot remove it while in use.
+        """
+        key = self.key(base, golden)
+        entry = self.entry_path(key)
+
+        with self._pinned(key):
+            async with self._build_locks.setdefault(key, asyncio.Lock()):
+                if self._read_meta(entry) is not None:
+                    logger.info(f"Tree cache hit: {key[:17]}")
+                    self._touch(entry)
+                else:
+                    logger.info(f"Tree cache miss: {key[:17]}, building...")
+                    await self._build(key, base, golden, build)
+            yield entry / "tree"
+
+    @contextmanager
+    def lookup(self, base: str, golden: str | None) -> Iterator[Path | None]:
+        """Yield the cached tree for (base, golden) pinned, or None if it is not cached."""
+        key = self.key(base, golden)
+        entry = self.entry_path(key)
+        with self._pinned(key):
+            if not self.enabled or self._read_meta(entry) is None:
+                yield None
+            else:
+                self._touch(entry)
+                yield entry / "tree"
+
+    @contextmanager
+    def _pinned(self, key: str) -> Iterator[None]:
+        with self._lock:
+            self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._pins[key] -= 1
+                if not self._pins[key]:
+                    del self._pins[key]
+
+    async def _build(self, key: str, base: str, golden: str | None, build: Callable[[Path], Awaitable[None]]):
+        self._ensure_root()
+        entry = self.entry_path(key)
+        if entry.exists() and self._read_meta(entry) is None:
+            # Leftover from an interrupted build.
+            await asyncio.to_thread(shutil.rmtree, entry, ignore_errors=True)
+        staging = self.root / f".tmp-{key}-{uuid.uuid4().hex[:8]}"
+        try:
+            (staging / "tree").mkdir(parents=True)
+            start = time.time()
+            await build(staging / "tree")
+            size_bytes, file_count = await asyncio.to_thread(tree_size, staging / "tree")
+            manifest = await asyncio.to_thread(build_manifest, staging / "tree")
+            with open(staging / "manifest.json", "w") as f:
+                json.dump(manifest, f)
+            meta = {
+                "format": CACHE_FORMAT,
+                "base": base,
+                "golden": golden,
+                "size_bytes": size_bytes,
+                "file_count": file_count,
+                "build_seconds": time.time() - start,
+            }
+            with open(staging / "meta.json", "w") as f:
+                json.dump(meta, f)
+            self._touch(staging)
+
+            try:
+                os.rename(staging, entry)
+            except OSError:
+                # Another process finished the same entry first; keep theirs.
+                logger.info(f"Tree cache entry {key[:17]} already built concurrently")
+        finally:
+            if staging.exists():
+                await asyncio.to_thread(shutil.rmtree, staging, ignore_errors=True)
+
+        await asyncio.to_thread(self.evict)
+
+    def meta(self, key: str) -> dict:
+        return self._read_meta(self.entry_path(key)) or {}
+
+    def manifest(self, key: str) -> dict[str, list] | None:
+        """Return the per-file hash manifest of a cached entry, if present."""
+        entry = self.entry_path(key)
+        try:
+            with open(entry / "manifest.json") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            if self._read_meta(entry) is None:
+                return None
+        except ValueError:
+            pass
+        # Entry predates manifests or the file is damaged; rebuild it in place.
+        manifest = build_manifest(entry / "tree")
+        atomic_write_json(entry / "manifest.json", manifest, private=False)
+        return manifest
+
+    async def baseline(self, key: str) -> Path | None:
+        """Return the entry's precomputed agent commit, building it on first use."""
+        entry = self.entry_path(key)
+        baseline = entry / "baseline"
+        if not (baseline / "baseline.json").exists():
+            if self._read_meta(entry) is None:
+                return None
+            logger.info(f"Building baseline commit for {key[:17]}...")
+            await build_baseline(entry / "tree", baseline)
+        return baseline
+
+    async def materialize(self, tree: Path, dest: str | Path):
+        """Clone a cached tree into dest (which must exist and be empty)."""
+        await async_proc.run("cp", "-a", "--reflink=auto", f"{tree}/.", str(dest))
+
+    def entries(self) -> list[tuple[str, dict, float]]:
+        """Return (key, meta, last_used) for every complete entry."""
+        result = []
+        if not self.root.exists():
+            return result
+        for entry in self.root.iterdir():
+            if entry.name.startswith("."):
+                continue
+            meta = self._read_meta(entry, any_format=True)
+            if meta is None:
+                continue
+            try:
+                last_used = (entry / "last_used").stat().st_mtime
+            except FileNotFoundError:
+                last_used = 0.0
+            result.append((entry.name, meta, last_used))
+        return result
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits its budget."""
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(meta.get("size_bytes", 0) for _, meta, _ in entries)
+            for key, meta, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                if key in self._pins:
+                    continue
+                logger.info(f"Tree cache evicting {key[:17]} ({meta.get('size_bytes', 0)} bytes)")
+                shutil.rmtree(self.entry_path(key), ignore_errors=True)
+                total -= meta.get("size_bytes", 0)
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(meta.get("size_bytes", 0) for _, meta, _ in entries),
+            "max_bytes": self.max_bytes,
+        }
+
+
+@functools.cache
+def default_tree_cache() -> TreeCache:
+    return TreeCache()
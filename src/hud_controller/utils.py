@@ -1,10 +1,31 @@
+import atexit
 import importlib
+import json
 import logging
+import logging.handlers
+import math
+import os
 import pkgutil
+import queue
+import re
+import stat
+import threading
+import uuid
 import xml.etree.ElementTree as ET
+from collections.abc import Iterable
+from pathlib import Path
 
 logger = logging.getLogger(__name__)
 
+_XML_DECLARATION = re.compile(r"<\?xml[^>]*\?>")
+
+# Per failing testcase, and how many failing testcases, JUnitTally keeps output for.
+MAX_FAILURE_OUTPUT_CHARS = 2000
+MAX_FAILURE_OUTPUTS = 50
+
+_log_queue_lock = threading.Lock()
+_log_listener: logging.handlers.QueueListener | None = None
+
 def import_submodules(module):
     """Import all submodules of a module, recursively"""
     for _loader, module_name, _is_pkg in pkgutil.walk_packages(
@@ -12,6 +33,138 @@ def import_submodules(module):
         importlib.import_module(module_name)
 
 
+def queue_logging(name: str = "hud_controller"):
+    """
+    Hand the records of logger `name` (and its children) to the root handlers
+    through a queue, so threads that log heavily never block on a slow handler.
+
+    Takes a snapshot of the root handlers on first use and is a no-op after
+    that, or when the root logger has no handlers yet.
+    """
+    global _log_listener
+    with _log_queue_lock:
+        root = logging.getLogger()
+        if _log_listener is not None or not root.handlers:
+            return
+        records: queue.SimpleQueue = queue.SimpleQueue()
+        _log_listener = logging.handlers.QueueListener(records, *root.handlers, respect_handler_level=True)
+        _log_listener.start()
+        atexit.register(_log_listener.stop)
+        target = logging.getLogger(name)
+        target.addHandler(logging.handlers.QueueHandler(records))
+        target.propagate = False
+
+
+def private_dir(path: str | os.PathLike) -> Path:
+    """
+    Create path as a 0700 directory of the current user and check it without
+    following symlinks: it must be a real directory owned by us, in a parent
+    nobody else can rename entries of. Raises PermissionError otherwise, e.g.
+    when the agent planted a symlink or its own directory there first.
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True, mode=0o700)
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.geteuid():
+        raise PermissionError(f"{path} is not a directory owned by uid {os.geteuid()}")
+    parent = os.lstat(path.parent)
+    if parent.st_uid not in (0, os.geteuid()) or (parent.st_mode & 0o022 and not parent.st_mode & stat.S_ISVTX):
+        raise PermissionError(f"{path.parent} is writable by other users")
+    os.chmod(path, 0o700)
+    return path
+
+
+def atomic_write_json(path: str | os.PathLike, data, private: bool = True, **dump_kwargs):
+    """
+    Write data as JSON to path through a 0600 temporary file and os.replace,
+    so readers never see a partial file. With private, the parent directory
+    is created (or tightened) as 0700 first.
+    """
+    path = Path(path)
+    if private:
+        path.parent.mkdir(parents=True, exist_ok=True, mode=0o700)
+        os.chmod(path.parent, 0o700)
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}")
+    try:
+        with open(os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+            json.dump(data, f, **dump_kwargs)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.unlink(tmp)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def available_cpus() -> int:
+    """
+    CPUs this process may actually use.
+
+    The smaller of the scheduler affinity mask and the cgroup CPU quota
+    (cgroup v2 cpu.max, falling back to v1 cfs_quota_us), rounded up.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+
+    quota = period = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            fields = f.read().split()
+        if fields[0] != "max":
+            quota, period = int(fields[0]), int(fields[1])
+    except (OSError, ValueError, IndexError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                quota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                period = int(f.read())
+        except (OSError, ValueError):
+            pass
+    if quota and period and quota > 0:
+        cpus = min(cpus, math.ceil(quota / period))
+    return max(1, cpus)
+
+
+def available_memory() -> int:
+    """
+    Bytes of memory this process can still use.
+
+    MemAvailable from /proc/meminfo, capped by the room left under the cgroup
+    memory limit (v2 memory.max, falling back to v1 limit_in_bytes).
+    """
+    available = 0
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError, IndexError):
+        pass
+
+    for limit_path, usage_path in (
+        ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory.current"),
+        ("/sys/fs/cgroup/memory/memory.limit_in_bytes", "/sys/fs/cgroup/memory/memory.usage_in_bytes"),
+    ):
+        try:
+            with open(limit_path) as f:
+                limit = f.read().strip()
+            with open(usage_path) as f:
+                usage = int(f.read())
+        except (OSError, ValueError):
+            continue
+        if limit != "max" and int(limit) < 1 << 60:
+            room = max(0, int(limit) - usage)
+            available = min(available, room) if available else room
+        break
+    return available
+
+
 def merge_junits(junit_xmls: list[str]) -> tuple[str, bool]:
     """
     Merge multiple JUnit XML strings into a single valid JUnit XML.
@@ -108,4 +261,82 @@ def merge_junits(junit_xmls: list[str]) -> tuple[str, bool]:
     
     full_success = (total_tests > 0 and total_skipped < total_tests and total_failures == 0 and total_errors == 0)
     
-    return f'<?xml version="1.0" encoding="UTF-8"?>\n{xml_str}', full_success
\ No newline at end of file
+    return f'<?xml version="1.0" encoding="UTF-8"?>\n{xml_str}', full_success
+
+class JUnitTally:
+    """
+    Running test counts over JUnit XML fragments, one fragment per package.
+
+    Each fragment goes through an XMLPullParser and every <testcase> is
+    dropped once counted, so memory stays bounded by a single testcase rather
+    than the whole report. Counts follow the <testsuite> tests / failures /
+    errors attributes, like the whole-document scoring did. A fragment that
+    does not parse is recorded in `malformed` and contributes nothing, instead
+    of invalidating every other package.
+    """
+
+    def __init__(self):
+        self.tests = 0
+        self.failures = 0
+        self.skipped = 0
+        # "classname/name" -> "pass" | "fail" | "skip"
+        self.outcomes: dict[str, str] = {}
+        # "classname/name" -> tail of the failure text, for the first few failures
+        self.failure_output: dict[str, str] = {}
+        self.malformed: list[str] = []
+
+    def feed(self, name: str, chunks: Iterable[str]) -> bool:
+        """Tally one fragment (given as text chunks); returns False if it was malformed."""
+        parser = ET.XMLPullParser(events=("end",))
+        tests = failures = skipped = 0
+        outcomes = {}
+        failure_output = {}
+        try:
+            # Wrap the fragment so several top-level elements still form one document.
+            parser.feed("<fragment>")
+            for chunk in chunks:
+                parser.feed(_XML_DECLARATION.sub("", chunk))
+                for _event, elem in parser.read_events():
+                    if elem.tag == "testcase":
+                        failure = elem.find("failure")
+                        if failure is None:
+                            failure = elem.find("error")
+                        if failure is not None:
+                            outcome = "fail"
+                            if len(self.failure_output) + len(failure_output) < MAX_FAILURE_OUTPUTS:
+                                text = failure.text or failure.get("message", "")
+                                failure_output[f"{elem.get('classname', '')}/{elem.get('name', '')}"] = (
+                                    text[-MAX_FAILURE_OUTPUT_CHARS:]
+                                )
+                        elif elem.find("skipped") is not None:
+                            outcome = "skip"
+                        else:
+                            outcome = "pass"
+                        outcomes[f"{elem.get('classname', '')}/{elem.get('name', '')}"] = outcome
+                        elem.clear()
+                    elif elem.tag == "testsuite":
+                        tests += int(elem.get("tests", 0))
+                        failures += int(elem.get("failures", 0)) + int(elem.get("errors", 0))
+                        skipped += int(elem.get("skipped", 0))
+                        elem.clear()
+            parser.feed("</fragment>")
+            parser.close()
+        except (ET.ParseError, ValueError) as e:
+            logger.warning(f"Malformed JUnit XML for {name}: {e}")
+            self.malformed.append(name)
+            return False
+
+        self.tests += tests
+        self.failures += failures
+        self.skipped += skipped
+        self.outcomes.update(outcomes)
+        self.failure_output.update(failure_output)
+        return True
+
+    def summary(self) -> dict:
+        return {
+            "tests": self.tests,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "malformed": list(self.malformed),
+        }
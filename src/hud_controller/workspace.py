@@ -0,0 +1,249 @@
+import grp
+import hashlib
+import json
+import logging
+import os
+import pwd
+import shutil
+from pathlib import Path
+
+from .tree_cache import TreeCache, hash_file, walk_files
+from .utils import atomic_write_json
+
+logger = logging.getLogger(__name__)
+
+AGENT_USER = "ubuntu"
+
+
+def stat_key(st: os.stat_result) -> list[int]:
+    """Fields that change whenever a file is rewritten, replaced or chmod-ed.
+
+    ctime is included because, unlike mtime, it cannot be set back by the agent.
+    """
+    return [st.st_ino, st.st_size, st.st_mode, st.st_mtime_ns, st.st_ctime_ns]
+
+
+def agent_ids() -> tuple[int, int]:
+    try:
+        return pwd.getpwnam(AGENT_USER).pw_uid, grp.getgrnam(AGENT_USER).gr_gid
+    except KeyError:
+        return 1000, 1000
+
+
+def as_agent() -> dict:
+    """Popen kwargs that run a child as the agent user when we are root."""
+    if os.geteuid() != 0:
+        return {}
+    uid, gid = agent_ids()
+    return {"user": uid, "group": gid, "extra_groups": []}
+
+
+class WorkspaceState:
+    """
+    Root-owned record of what a workspace held right after setup.
+
+    Stored next to the tree cache (outside the agent's reach) so that the next
+    setup can tell which files were touched since, without hashing the tree.
+    """
+
+    def __init__(self, tree_cache: TreeCache, repo_path: str):
+        self._tree_cache = tree_cache
+        self.repo_path = os.path.realpath(repo_path)
+        digest = hashlib.sha1(self.repo_path.encode()).hexdigest()[:16]
+        self.path = tree_cache.root / "workspaces" / f"{digest}.json"
+
+    def load(self) -> dict | None:
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if state.get("repo_path") != self.repo_path:
+            return None
+        return state
+
+    def save(self, key: str, stats: dict[str, list[int]]):
+        atomic_write_json(self.path, {"repo_path": self.repo_path, "key": key, "stats": stats})
+
+    def move_to(self, repo_path: str):
+        """Re-home this record after the workspace directory was renamed."""
+        state = self.load()
+        self.clear()
+        target = WorkspaceState(self._tree_cache, repo_path)
+        if state is None:
+            target.clear()
+        else:
+            target.save(state["key"], state["stats"])
+
+    def clear(self):
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def snapshot(repo_path: str) -> dict[str, list[int]]:
+    """Stat every workspace file outside the agent's .git directory."""
+    return {rel: stat_key(st) for rel, st in walk_files(repo_path, skip=(".git",))}
+
+
+def _manifest_dirs(manifest: dict[str, list]) -> set[str]:
+    dirs = {""}
+    for rel in manifest:
+        parent = os.path.dirname(rel)
+        while parent not in dirs:
+            dirs.add(parent)
+            parent = os.path.dirname(parent)
+    return dirs
+
+
+def _restore(repo_path: str, tree: Path, rel: str, uid: int, gid: int) -> list[int]:
+    """Put the cached tree's copy of rel into the workspace and return its stat key."""
+    src = os.path.join(tree, rel)
+    dest = os.path.join(repo_path, rel)
+
+    parent = os.path.dirname(dest)
+    missing = []
+    while not os.path.isdir(parent):
+        missing.append(parent)
+        parent = os.path.dirname(parent)
+    for d in reversed(missing):
+        if os.path.lexists(d):
+            os.unlink(d)
+        os.mkdir(d)
+        os.chown(d, uid, gid)
+
+    if os.path.isdir(dest) and not os.path.islink(dest):
+        shutil.rmtree(dest)
+    elif os.path.lexists(dest):
+        os.unlink(dest)
+
+    if os.path.islink(src):
+        os.symlink(os.readlink(src), dest)
+    else:
+        # A copy, never a hardlink: in-place writes must not reach the cache.
+        shutil.copy2(src, dest)
+    os.lchown(dest, uid, gid)
+    return stat_key(os.lstat(dest))
+
+
+def reset_workspace(
+    repo_path: str,
+    tree: Path,
+    manifest: dict[str, list],
+    prev_manifest: dict[str, list] | None,
+    prev_stats: dict[str, list[int]],
+) -> tuple[dict[str, list[int]], dict[str, int]]:
+    """
+    Bring repo_path in line with a cached tree by touching only what differs.
+
+    Files whose stat matches the previous setup's snapshot are assumed to still
+    hold the previous manifest's content; anything else is hashed. Paths that
+    differ from the target manifest are restored from the cached tree, paths it
+    does not contain are deleted. The top-level .git directory is left alone.
+
+    Returns the new stat snapshot and counters for logging.
+    """
+    prev_manifest = prev_manifest or {}
+    expected_dirs = _manifest_dirs(manifest)
+
+    remove_files = []
+    remove_dirs = []
+    restore = []
+    hashed = 0
+    seen = set()
+    stats = {}
+
+    for dirpath, dirnames, filenames in os.walk(repo_path):
+        rel_dir = os.path.relpath(dirpath, repo_path)
+        if rel_dir == ".":
+            rel_dir = ""
+            dirnames[:] = [d for d in dirnames if d != ".git"]
+
+        for name in list(dirnames):
+            rel = os.path.join(rel_dir, name)
+            if os.path.islink(os.path.join(dirpath, name)):
+                dirnames.remove(name)
+                filenames.append(name)
+            elif rel not in expected_dirs:
+                dirnames.remove(name)
+                remove_dirs.append(rel)
+
+        for name in filenames:
+            rel = os.path.join(rel_dir, name)
+            full = os.path.join(dirpath, name)
+            target = manifest.get(rel)
+            if target is None:
+                remove_files.append(rel)
+                continue
+            seen.add(rel)
+
+            st = os.lstat(full)
+            # Mode first: a FIFO or socket in place of a file is never opened.
+            if st.st_mode != target[2]:
+                restore.append(rel)
+                continue
+            key = stat_key(st)
+            if prev_stats.get(rel) == key and rel in prev_manifest:
+                digest = prev_manifest[rel][0]
+            else:
+                try:
+                    digest = hash_file(full, st)
+                except OSError:
+                    # Swapped for something unreadable since the lstat.
+                    restore.append(rel)
+                    continue
+                hashed += 1
+
+            if digest != target[0]:
+                restore.append(rel)
+            else:
+                stats[rel] = key
+
+    restore.extend(rel for rel in manifest if rel not in seen)
+
+    for rel in remove_dirs:
+        shutil.rmtree(os.path.join(repo_path, rel))
+    for rel in remove_files:
+        os.unlink(os.path.join(repo_path, rel))
+
+    uid, gid = agent_ids()
+    for rel in restore:
+        stats[rel] = _restore(repo_path, tree, rel, uid, gid)
+
+    counts = {
+        "restored": len(restore),
+        "removed": len(remove_files) + len(remove_dirs),
+        "hashed": hashed,
+        "unchanged": len(manifest) - len(restore),
+    }
+    return stats, counts
+
+
+def changed_files(repo_path: str, manifest: dict[str, list], prev_stats: dict[str, list[int]]) -> list[str]:
+    """
+    Paths whose content or mode differs from the manifest, plus added and deleted ones.
+
+    Files whose stat still matches the setup snapshot are trusted unchanged,
+    like in reset_workspace; the top-level .git directory is ignored.
+    """
+    changed = []
+    seen = set()
+    for rel, st in walk_files(repo_path, skip=(".git",)):
+        target = manifest.get(rel)
+        if target is None:
+            changed.append(rel)
+            continue
+        seen.add(rel)
+        if prev_stats.get(rel) == stat_key(st):
+            continue
+        if st.st_mode != target[2]:
+            changed.append(rel)
+            continue
+        try:
+            if hash_file(os.path.join(repo_path, rel), st) != target[0]:
+                changed.append(rel)
+        except OSError:
+            changed.append(rel)
+    changed.extend(rel for rel in manifest if rel not in seen)
+    return sorted(changed)
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from collections.abc import Callable
+from pathlib import Path
+
+from .go_modules import FingerprintStore
+from .setup import setup_codebase
+from .spec import ProblemSpec
+from .trash import default_trash
+from .tree_cache import default_tree_cache
+from .utils import private_dir
+from .workspace import WorkspaceState
+
+logger = logging.getLogger(__name__)
+
+
+class WorkspacePool:
+    """
+    Background pool of fully set-up workspaces for upcoming problems.
+
+    A single builder task runs `setup_codebase` into private directories under
+    a root-only pool directory next to the agent's home (/home/.workspace_pool
+    for the default REPO_PATH, on its filesystem) for the next `size` problem ids, taken from a queue sent by the
+    harness or, failing that, from the order of PROBLEM_REGISTRY after the last
+    problem set up. A pool hit swaps the ready directory into REPO_PATH with two
+    renames; a miss falls back to the normal setup path.
+    """
+
+    def __init__(
+        self,
+        resolve: Callable[[str], ProblemSpec],
+        registry_ids: Callable[[], list[str]],
+        size: int | None = None,
+        repo_path: str | None = None,
+        pool_dir: str | None = None,
+    ):
+        self.resolve = resolve
+        self.registry_ids = registry_ids
+        self.size = int(os.environ.get("WORKSPACE_POOL_SIZE", 0)) if size is None else size
+        self.repo_path = repo_path or os.environ.get("REPO_PATH", "/home/ubuntu/repo")
+        self.pool_dir = Path(
+            pool_dir
+            or os.environ.get("WORKSPACE_POOL_DIR")
+            or os.path.join(os.path.dirname(os.path.dirname(self.repo_path.rstrip("/"))), ".workspace_pool")
+        )
+
+        self._cond = asyncio.Condition()
+        self._queue: list[str] = []
+        self._last: str | None = None
+        self._ready: dict[str, Path] = {}
+        self._building: str | None = None
+        self._failed: set[str] = set()
+        self._task: asyncio.Task | None = None
+
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.build_seconds: list[float] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    def _wanted(self) -> list[str]:
+        if self._queue:
+            return self._queue[: self.size]
+        ids = self.registry_ids()
+        if not ids:
+            return []
+        start = ids.index(self._last) + 1 if self._last in ids else 0
+        return [ids[(start + i) % len(ids)] for i in range(min(self.size, len(ids)))]
+
+    def _next_to_build(self) -> str | None:
+        for problem_id in self._wanted():
+            if problem_id in self._ready or problem_id in self._failed or problem_id == self._building:
+                continue
+            return problem_id
+        return None
+
+    def _prune(self) -> list[Path]:
+        wanted = set(self._wanted())
+        stale = [pid for pid in self._ready if pid not in wanted]
+        return [self._ready.pop(pid) for pid in stale]
+
+    def _discard(self, paths: list[Path]):
+        for path in paths:
+            WorkspaceState(default_tree_cache(), str(path)).clear()
+            FingerprintStore().clear(str(path))
+            default_trash().discard(path)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            try:
+                private_dir(self.pool_dir)
+            except PermissionError as e:
+                # A slot the agent can reach could become the next workspace.
+                logger.error(f"Workspace pool disabled, unsafe pool directory {self.pool_dir}: {e}")
+                self.size = 0
+                return
+            self._task = asyncio.get_running_loop().create_task(self._run(), name="workspace-pool")
+
+    async def enqueue(self, problem_ids: list[str]):
+        """Replace the harness-provided queue of upcoming problem ids."""
+        if not self.enabled:
+            return
+        async with self._cond:
+            self._queue = list(dict.fromkeys(problem_ids))
+            self._failed.clear()
+            stale = self._prune()
+            self._ensure_started()
+            self._cond.notify_all()
+        self._discard(stale)
+
+    async def advance(self, problem_id: str):
+        """Record that problem_id was just set up and refill the pool."""
+        if not self.enabled:
+            return
+        async with self._cond:
+            if problem_id in self._queue:
+                del self._queue[: self._queue.index(problem_id) + 1]
+            self._last = problem_id
+            self._failed.clear()
+            stale = self._prune()
+            self._ensure_started()
+            self._cond.notify_all()
+        self._discard(stale)
+
+    async def take(self, problem_id: str) -> bool:
+        """Swap a ready workspace for problem_id into REPO_PATH, if there is one."""
+        if not self.enabled:
+            return False
+        async with self._cond:
+            await self._cond.wait_for(lambda: self._building != problem_id)
+            slot = self._ready.pop(problem_id, None)
+            if slot is None:
+                self.misses += 1
+                logger.info(f"Workspace pool miss: {problem_id}")
+                return False
+
+        old = self.pool_dir / f".old-{uuid.uuid4().hex[:8]}"
+        try:
+            if os.path.exists(self.repo_path):
+                os.rename(self.repo_path, old)
+            os.rename(slot, self.repo_path)
+        except OSError as e:
+            logger.warning(f"Workspace pool swap failed ({e}), falling back to setup")
+            if old.exists() and not os.path.exists(self.repo_path):
+                os.rename(old, self.repo_path)
+            self.misses += 1
+            self._discard([slot])
+            return False
+
+        WorkspaceState(default_tree_cache(), str(slot)).move_to(self.repo_path)
+        FingerprintStore().move(str(slot), self.repo_path)
+        if old.exists():
+            self._discard([old])
+        self.hits += 1
+        logger.info(f"Workspace pool hit: {problem_id}")
+        return True
+
+    async def _run(self):
+        while True:
+            async with self._cond:
+                while (problem_id := self._next_to_build()) is None:
+                    await self._cond.wait()
+                self._building = problem_id
+
+            slot = self.pool_dir / f"{problem_id}-{uuid.uuid4().hex[:8]}"
+            start = time.time()
+            try:
+                spec = self.resolve(problem_id)
+                slot.mkdir()
+                await setup_codebase(spec.base, spec.test, spec.golden, repo_path=str(slot))
+            except asyncio.CancelledError:
+                self._building = None
+                self._discard([slot])
+                raise
+            except Exception as e:
+                logger.error(f"Workspace pool build failed for {problem_id}: {e}")
+                async with self._cond:
+                    self.failures += 1
+                    self._building = None
+                    # Don't retry this id until the wanted list changes.
+                    self._failed.add(problem_id)
+                    self._cond.notify_all()
+                self._discard([slot])
+                continue
+
+            elapsed = time.time() - start
+            logger.info(f"Workspace pool built {problem_id} in {elapsed:.1f}s")
+            async with self._cond:
+                self.build_seconds.append(elapsed)
+                self._building = None
+                if problem_id in self._wanted():
+                    self._ready[problem_id] = slot
+                    slot = None
+                self._cond.notify_all()
+            if slot is not None:
+                self._discard([slot])
+
+    def stats(self) -> dict:
+        builds = len(self.build_seconds)
+        return {
+            "enabled": self.enabled,
+            "size": self.size,
+            "ready": sorted(self._ready),
+            "building": self._building,
+            "queued": list(self._queue),
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "builds": builds,
+            "build_seconds_total": sum(self.build_seconds),
+            "build_seconds_mean": sum(self.build_seconds) / builds if builds else 0.0,
+            "build_seconds_last": self.build_seconds[-1] if builds else None,
+        }
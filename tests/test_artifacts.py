@@ -0,0 +1,47 @@
+import os
+import time
+
+from hud_controller.grading_runner import open_artifacts
+
+
+def _age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_prunes_oldest_but_not_in_use(tmp_path, monkeypatch):
+    monkeypatch.setenv("GRADING_ARTIFACTS_DIR", str(tmp_path))
+    monkeypatch.setenv("GRADING_ARTIFACTS_KEEP", "1")
+
+    with open_artifacts("live") as live:
+        _age(live, 300)
+        with open_artifacts("done") as done:
+            pass
+        _age(done, 200)
+        legacy = tmp_path / "legacy"
+        legacy.mkdir()
+        _age(legacy, 400)
+
+        with open_artifacts("new") as new:
+            (new / "junit.xml").write_text("<testsuites/>")
+
+        assert live.exists()
+        assert not legacy.exists()
+        assert not done.exists()
+        assert new.exists()
+
+    # Once the grading is over its directory can go like any other.
+    with open_artifacts("later") as later:
+        pass
+    assert not live.exists()
+    assert not new.exists()
+    assert [p.name for p in tmp_path.iterdir() if not p.name.startswith(".")] == [later.name]
+
+
+def test_falls_back_to_a_temporary_directory(tmp_path, monkeypatch):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    monkeypatch.setenv("GRADING_ARTIFACTS_DIR", str(blocker / "artifacts"))
+    with open_artifacts("x") as path:
+        assert path.is_dir()
+        assert not str(path).startswith(str(tmp_path))
@@ -0,0 +1,91 @@
+import pytest
+
+from hud_controller.baselines import build_baseline, score, selection
+
+MODULE = "ex.com/m"
+
+BASELINE = {
+    "packages": {
+        "ex.com/m/a": {
+            "dir": "./a",
+            "tests": {
+                "TestFixed": "fp",
+                "TestNew": "-p",
+                "TestKept": "pp",
+                "TestKept/sub": "pp",
+                "TestBroken": "pf",
+                "TestFlaky": "f-",
+            },
+        },
+        "ex.com/m/b": {"dir": "./b", "tests": {"TestOther": "pp"}},
+    },
+}
+
+
+def test_selection():
+    assert selection(BASELINE) == {
+        "fail_to_pass": {"ex.com/m/a": ["TestFixed", "TestNew"]},
+        "pass_to_pass": {"ex.com/m/a": ["TestKept", "TestKept/sub"], "ex.com/m/b": ["TestOther"]},
+    }
+
+
+ALL_PASS = {
+    "ex.com/m/a/TestFixed": "pass",
+    "ex.com/m/a/TestNew": "pass",
+    "ex.com/m/a/TestKept": "pass",
+    "ex.com/m/a/TestKept/sub": "pass",
+    "ex.com/m/b/TestOther": "pass",
+}
+
+
+def _without(*keys):
+    return {key: outcome for key, outcome in ALL_PASS.items() if key not in keys}
+
+
+@pytest.mark.parametrize(
+    "outcomes, fail_to_pass, pass_to_pass, score_",
+    [
+        (ALL_PASS, [], [], 1.0),
+        # Ungraded tests in the report change nothing.
+        ({**ALL_PASS, "ex.com/m/a/TestBroken": "fail", "ex.com/m/c/TestX": "fail"}, [], [], 1.0),
+        ({**ALL_PASS, "ex.com/m/a/TestFixed": "fail"}, ["ex.com/m/a/TestFixed"], [], 0.8),
+        ({**ALL_PASS, "ex.com/m/a/TestNew": "skip"}, ["ex.com/m/a/TestNew"], [], 0.8),
+        # Tests missing from the report count as failed.
+        (_without("ex.com/m/a/TestNew"), ["ex.com/m/a/TestNew"], [], 0.8),
+        (_without("ex.com/m/a/TestKept/sub"), [], ["ex.com/m/a/TestKept/sub"], 0.8),
+        (
+            # A package that did not report at all, e.g. it failed to build.
+            _without("ex.com/m/b/TestOther"),
+            [],
+            ["ex.com/m/b/TestOther"],
+            0.8,
+        ),
+        (
+            {},
+            ["ex.com/m/a/TestFixed", "ex.com/m/a/TestNew"],
+            ["ex.com/m/a/TestKept", "ex.com/m/a/TestKept/sub", "ex.com/m/b/TestOther"],
+            0.0,
+        ),
+    ],
+    ids=["all-pass", "extra", "fail", "skip", "missing-f2p", "missing-subtest", "missing-package", "empty-report"],
+)
+def test_score(outcomes, fail_to_pass, pass_to_pass, score_):
+    result = score(BASELINE, outcomes)
+    assert result["fail_to_pass"] == {"passed": 2 - len(fail_to_pass), "total": 2, "failed": fail_to_pass}
+    assert result["pass_to_pass"] == {"passed": 3 - len(pass_to_pass), "total": 3, "failed": pass_to_pass}
+    assert result["score"] == pytest.approx(score_)
+
+
+def test_score_without_graded_tests():
+    baseline = {"packages": {"ex.com/m/a": {"dir": "./a", "tests": {"TestBroken": "pf"}}}}
+    assert score(baseline, {})["score"] == 0.0
+
+
+def test_build_baseline():
+    buggy = {"ex.com/m/a/TestFixed": "fail", "ex.com/m/a/TestKept": "pass", "ex.com/m/a/TestMain": "fail"}
+    golden = {"ex.com/m/a/TestFixed": "pass", "ex.com/m/a/TestKept": "pass", "ex.com/m/a/TestNew": "pass"}
+    assert build_baseline(buggy, golden, MODULE) == {
+        "packages": {
+            "ex.com/m/a": {"dir": "./a", "tests": {"TestFixed": "fp", "TestKept": "pp", "TestNew": "-p"}},
+        },
+    }
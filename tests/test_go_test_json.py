@@ -0,0 +1,151 @@
+import json
+
+import pytest
+
+from hud_controller import go_test_json
+from hud_controller.utils import JUnitTally
+
+
+def _event(action, package=None, test=None, **fields):
+    event = {"Action": action}
+    if package is not None:
+        event["Package"] = package
+    if test is not None:
+        event["Test"] = test
+    event.update(fields)
+    return json.dumps(event)
+
+
+def _feed(lines):
+    stream = go_test_json.Test2JSONStream()
+    finished = [package.name for line in lines if (package := stream.feed(line)) is not None]
+    return stream, finished
+
+
+def _tally(stream):
+    tally = JUnitTally()
+    for name, suite in stream.junit_suites():
+        assert tally.feed(name, [suite])
+    return tally
+
+
+INTERLEAVED = [
+    _event("start", "ex/a"),
+    _event("start", "ex/b"),
+    _event("run", "ex/a", "TestA1"),
+    _event("run", "ex/b", "TestB1"),
+    _event("output", "ex/b", "TestB1", Output="    b_test.go:9: boom\n"),
+    _event("output", "ex/a", "TestA1", Output="=== RUN   TestA1\n"),
+    _event("pass", "ex/a", "TestA1", Elapsed=0.1),
+    _event("fail", "ex/b", "TestB1", Elapsed=0.2),
+    _event("run", "ex/a", "TestA2"),
+    _event("skip", "ex/a", "TestA2", Elapsed=0),
+    _event("fail", "ex/b", Elapsed=0.3),
+    _event("pass", "ex/a", Elapsed=0.4),
+]
+
+# Go 1.24+: compiler errors arrive as build-output events keyed by ImportPath.
+BUILD_OUTPUT_EVENTS = [
+    json.dumps({"ImportPath": "ex/b [ex/b.test]", "Action": "build-output", "Output": "# ex/b [ex/b.test]\n"}),
+    json.dumps({
+        "ImportPath": "ex/b [ex/b.test]", "Action": "build-output",
+        "Output": "b/b_test.go:3:2: undefined: missing\n",
+    }),
+    json.dumps({"ImportPath": "ex/b [ex/b.test]", "Action": "build-fail"}),
+    _event("start", "ex/b"),
+    _event("output", "ex/b", Output="FAIL\tex/b [build failed]\n"),
+    _event("fail", "ex/b", Elapsed=0, FailedBuild="ex/b [ex/b.test]"),
+]
+
+# Before Go 1.24: the compiler output and the FAIL line bypass test2json.
+BUILD_FAILED_TEXT = [
+    "# ex/b [ex/b.test]",
+    "b/b_test.go:3:2: undefined: missing",
+    "FAIL\tex/b [build failed]",
+]
+
+
+@pytest.mark.parametrize(
+    "lines, finished, statuses, counts",
+    [
+        (
+            INTERLEAVED,
+            ["ex/b", "ex/a"],
+            {"ex/a": "pass", "ex/b": "fail"},
+            {"tests": 3, "failures": 1, "skipped": 1},
+        ),
+        (
+            [_event("start", "ex/a"), _event("skip", "ex/a", Elapsed=0)],
+            ["ex/a"],
+            {"ex/a": "skip"},
+            {"tests": 0, "failures": 0, "skipped": 0},
+        ),
+        (
+            # A panic ends the binary with a test still running.
+            [_event("run", "ex/a", "TestA1"), _event("fail", "ex/a", Elapsed=1)],
+            ["ex/a"],
+            {"ex/a": "fail"},
+            {"tests": 1, "failures": 1, "skipped": 0},
+        ),
+        (
+            BUILD_OUTPUT_EVENTS + [_event("run", "ex/a", "TestA1"), _event("pass", "ex/a", "TestA1"), _event("pass", "ex/a")],
+            ["ex/b", "ex/a"],
+            {"ex/a": "pass", "ex/b": "fail"},
+            {"tests": 2, "failures": 1, "skipped": 0},
+        ),
+        (
+            BUILD_FAILED_TEXT,
+            ["ex/b"],
+            {"ex/b": "fail"},
+            {"tests": 1, "failures": 1, "skipped": 0},
+        ),
+    ],
+    ids=["interleaved", "package-skip", "panic", "build-output-events", "build-failed-text"],
+)
+def test_stream(lines, finished, statuses, counts):
+    stream, done = _feed(lines)
+    assert done == finished
+    assert {name: package.status for name, package in stream.packages.items()} == statuses
+    summary = _tally(stream).summary()
+    assert {key: summary[key] for key in counts} == counts
+    assert summary["malformed"] == []
+
+
+@pytest.mark.parametrize("lines", [BUILD_OUTPUT_EVENTS, BUILD_FAILED_TEXT], ids=["events", "text"])
+def test_build_failure(lines):
+    stream, _ = _feed(lines)
+    package = stream.packages["ex/b"]
+    assert package.build_failed
+    assert stream.diagnostics() == [
+        {"package": "ex/b", "file": "b/b_test.go", "line": 3, "column": 2, "message": "undefined: missing"},
+    ]
+    tally = _tally(stream)
+    assert tally.outcomes == {"ex/b/TestMain": "fail"}
+    assert "undefined: missing" in tally.failure_output["ex/b/TestMain"]
+
+
+def test_interleaved_output_stays_with_its_test():
+    stream, _ = _feed(INTERLEAVED)
+    assert stream.packages["ex/b"].tests["TestB1"].output == ["    b_test.go:9: boom\n"]
+    # Passing tests carry no output.
+    assert stream.packages["ex/a"].tests["TestA1"].output == []
+
+
+@pytest.mark.parametrize("timed_out, message", [(False, "Failed"), (True, "Timeout")])
+def test_finish_fails_unconcluded_packages(timed_out, message):
+    stream, _ = _feed([_event("run", "ex/a", "TestA1")])
+    stream.finish(timed_out=timed_out)
+    assert stream.packages["ex/a"].status == "fail"
+    assert stream.packages["ex/a"].tests["TestA1"].timed_out == timed_out
+    [(_, suite)] = stream.junit_suites()
+    assert f'message="{message}"' in suite
+
+
+def test_merge_shards():
+    first, _ = _feed([_event("run", "ex/a", "TestA1"), _event("pass", "ex/a", "TestA1"), _event("pass", "ex/a", Elapsed=1)])
+    second, _ = _feed([_event("run", "ex/a", "TestA2"), _event("fail", "ex/a", "TestA2"), _event("fail", "ex/a", Elapsed=2)])
+    first.merge(second)
+    package = first.packages["ex/a"]
+    assert package.status == "fail"
+    assert package.elapsed == 2
+    assert sorted(package.tests) == ["TestA1", "TestA2"]
@@ -0,0 +1,49 @@
+import re
+
+import pytest
+
+from hud_controller.grading_runner import split_shards
+from hud_controller.test_focus import run_filter
+
+
+@pytest.mark.parametrize(
+    "names, shards, expected",
+    [
+        ([], 4, []),
+        (["TestA"], 4, [["TestA"]]),
+        (["TestA", "TestB"], 0, [["TestA", "TestB"]]),
+        (["TestA", "TestB", "TestC"], 1, [["TestA", "TestB", "TestC"]]),
+        (["TestA", "TestB", "TestC"], 2, [["TestA", "TestC"], ["TestB"]]),
+        (["TestA", "TestB", "TestC"], 8, [["TestA"], ["TestB"], ["TestC"]]),
+    ],
+)
+def test_split_shards(names, shards, expected):
+    assert split_shards(names, shards) == expected
+
+
+@pytest.mark.parametrize(
+    "names, matches, misses",
+    [
+        ([], [], ["TestA"]),
+        (["TestA"], ["TestA"], ["TestAB", "XTestA", "TestB"]),
+        (["TestA", "TestB"], ["TestA", "TestB"], ["TestAB", "TestC"]),
+        # Metacharacters are matched literally, not as regex syntax.
+        (["Test.A"], ["Test.A"], ["TestxA"]),
+        (["Test+A", "Test(B)"], ["Test+A", "Test(B)"], ["TestA", "TesttA", "TestB"]),
+        (["Test|All"], ["Test|All"], ["Test", "All"]),
+        (["Test[0-9]", "Test$"], ["Test[0-9]", "Test$"], ["Test5", "Test"]),
+    ],
+)
+def test_run_filter(names, matches, misses):
+    pattern = re.compile(run_filter(names))
+    for name in matches:
+        assert pattern.search(name), name
+    for name in misses:
+        assert not pattern.search(name), name
+
+
+def test_run_filter_covers_every_shard():
+    names = [f"Test{i}" for i in range(10)]
+    filters = [re.compile(run_filter(group)) for group in split_shards(names, 3)]
+    for name in names:
+        assert sum(bool(f.search(name)) for f in filters) == 1
@@ -0,0 +1,135 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from hud_controller.test_manifest import build_manifest, verify
+
+
+def _git(repo, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=t", "-c", "user.email=t@example.com", *args],
+        cwd=repo, check=True, capture_output=True,
+    )
+
+
+def _write(repo, rel, text):
+    path = os.path.join(repo, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    """A tiny repository with a test/ tree at HEAD, checked out as committed."""
+    repo = str(tmp_path / "repo")
+    os.makedirs(repo)
+    _git(repo, "init", "-q")
+    _write(repo, "main.go", "package main\n")
+    _write(repo, "test/e2e/a_test.go", "package e2e\n")
+    _write(repo, "test/e2e/b_test.go", "package e2e\n")
+    _write(repo, "test/run.sh", "#!/bin/sh\n")
+    os.chmod(os.path.join(repo, "test/run.sh"), 0o755)
+    os.symlink("e2e/a_test.go", os.path.join(repo, "test/link_test.go"))
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "golden")
+    return repo
+
+
+def _manifest(repo):
+    return build_manifest(os.path.join(repo, ".git"), "HEAD")
+
+
+def _modify(repo):
+    _write(repo, "test/e2e/a_test.go", "package e2e // changed\n")
+
+
+def _chmod(repo):
+    os.chmod(os.path.join(repo, "test/run.sh"), 0o644)
+
+
+def _retarget(repo):
+    os.unlink(os.path.join(repo, "test/link_test.go"))
+    os.symlink("e2e/b_test.go", os.path.join(repo, "test/link_test.go"))
+
+
+def _remove(repo):
+    os.unlink(os.path.join(repo, "test/e2e/b_test.go"))
+
+
+def _add(repo):
+    _write(repo, "test/e2e/c_test.go", "package e2e\n")
+
+
+def _symlink_dir(repo):
+    elsewhere = os.path.join(os.path.dirname(repo), "elsewhere")
+    shutil.copytree(os.path.join(repo, "test/e2e"), elsewhere)
+    shutil.rmtree(os.path.join(repo, "test/e2e"))
+    os.symlink(elsewhere, os.path.join(repo, "test/e2e"))
+
+
+def _symlink_top(repo):
+    elsewhere = os.path.join(os.path.dirname(repo), "elsewhere")
+    shutil.copytree(os.path.join(repo, "test"), elsewhere, symlinks=True)
+    shutil.rmtree(os.path.join(repo, "test"))
+    os.symlink(elsewhere, os.path.join(repo, "test"))
+
+
+def _file_for_dir(repo):
+    shutil.rmtree(os.path.join(repo, "test/e2e"))
+    _write(repo, "test/e2e", "not a directory\n")
+
+
+def _outside(repo):
+    _write(repo, "main.go", "package main // changed\n")
+
+
+ALL = ["test/e2e/a_test.go", "test/e2e/b_test.go", "test/link_test.go", "test/run.sh"]
+
+
+@pytest.mark.parametrize(
+    "change, expected",
+    [
+        (None, {"missing": [], "modified": [], "added": []}),
+        (_modify, {"missing": [], "modified": ["test/e2e/a_test.go"], "added": []}),
+        (_chmod, {"missing": [], "modified": ["test/run.sh"], "added": []}),
+        (_retarget, {"missing": [], "modified": ["test/link_test.go"], "added": []}),
+        (_remove, {"missing": ["test/e2e/b_test.go"], "modified": [], "added": []}),
+        (_add, {"missing": [], "modified": [], "added": ["test/e2e/c_test.go"]}),
+        (
+            _symlink_dir,
+            {"missing": ["test/e2e/a_test.go", "test/e2e/b_test.go"], "modified": [], "added": ["test/e2e"]},
+        ),
+        (_symlink_top, {"missing": ALL, "modified": [], "added": []}),
+        (
+            _file_for_dir,
+            {"missing": ["test/e2e/a_test.go", "test/e2e/b_test.go"], "modified": [], "added": ["test/e2e"]},
+        ),
+        (_outside, {"missing": [], "modified": [], "added": []}),
+    ],
+    ids=lambda v: v.__name__.strip("_") if callable(v) else None,
+)
+def test_verify(repo, change, expected):
+    manifest = _manifest(repo)
+    assert sorted(manifest) == ALL
+    if change:
+        change(repo)
+    assert verify(repo, manifest) == expected
+
+
+def test_build_manifest_lays_golden_over_base(repo):
+    _git(repo, "tag", "base")
+    _modify(repo)
+    _remove(repo)
+    _add(repo)
+    _git(repo, "add", "-A")
+    _git(repo, "commit", "-q", "-m", "golden2")
+    git_dir = os.path.join(repo, ".git")
+
+    manifest = build_manifest(git_dir, "HEAD", base="base")
+    # Files only base has are expected too; golden's version wins.
+    assert sorted(manifest) == sorted(ALL + ["test/e2e/c_test.go"])
+    assert manifest["test/e2e/a_test.go"] == build_manifest(git_dir, "HEAD")["test/e2e/a_test.go"]
+    assert build_manifest(git_dir, "HEAD", base="no-such-commit") is None
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+from hud_controller.grading_runner import GradingRunner
+from hud_controller.utils import JUnitTally
+
+
+def _timeout_xml(events_path):
+    runner = GradingRunner.__new__(GradingRunner)
+    xml = runner._timeout_xml("ex/a", events_path, "Package exceeded its budget")
+    tally = JUnitTally()
+    assert tally.feed("ex/a", [xml])
+    return tally
+
+
+def _events(tmp_path, *events):
+    path = tmp_path / "events.json"
+    path.write_text("".join(json.dumps(event) + "\n" for event in events))
+    return str(path)
+
+
+@pytest.mark.parametrize(
+    "events_path",
+    [None, "missing.json", "directory"],
+    ids=["none", "missing", "unreadable"],
+)
+def test_without_events(tmp_path, events_path):
+    if events_path is not None:
+        events_path = str(tmp_path / events_path)
+        if events_path.endswith("directory"):
+            (tmp_path / "directory").mkdir()
+    tally = _timeout_xml(events_path)
+    assert tally.outcomes == {"ex/a/Timeout": "fail"}
+    assert tally.failure_output["ex/a/Timeout"] == "Package exceeded its budget"
+
+
+def test_keeps_finished_tests(tmp_path):
+    events_path = _events(
+        tmp_path,
+        {"Action": "run", "Package": "ex/a", "Test": "TestDone"},
+        {"Action": "pass", "Package": "ex/a", "Test": "TestDone"},
+        {"Action": "run", "Package": "ex/a", "Test": "TestHung"},
+    )
+    tally = _timeout_xml(events_path)
+    assert tally.outcomes == {"ex/a/TestDone": "pass", "ex/a/TestHung": "fail"}
@@ -0,0 +1,82 @@
+import pytest
+
+from hud_controller.utils import MAX_FAILURE_OUTPUTS, JUnitTally, atomic_write_json
+
+
+def _suite(name, cases, skipped=0, errors=0):
+    failures = sum("<failure" in case for case in cases)
+    return (
+        f'<testsuite name="{name}" tests="{len(cases)}" failures="{failures}" errors="{errors}" skipped="{skipped}">'
+        + "".join(cases)
+        + "</testsuite>"
+    )
+
+
+PASS = '<testcase classname="p" name="TestPass"/>'
+FAIL = '<testcase classname="p" name="TestFail"><failure message="Failed">boom</failure></testcase>'
+ERROR = '<testcase classname="p" name="TestError"><error message="panic"/></testcase>'
+SKIP = '<testcase classname="p" name="TestSkip"><skipped message="short"/></testcase>'
+
+
+@pytest.mark.parametrize(
+    "chunks, summary, outcomes",
+    [
+        ([], {"tests": 0, "failures": 0, "skipped": 0}, {}),
+        ([_suite("p", [PASS])], {"tests": 1, "failures": 0, "skipped": 0}, {"p/TestPass": "pass"}),
+        (
+            [_suite("p", [PASS, FAIL, SKIP], skipped=1)],
+            {"tests": 3, "failures": 1, "skipped": 1},
+            {"p/TestPass": "pass", "p/TestFail": "fail", "p/TestSkip": "skip"},
+        ),
+        # <error> counts as a failure, both per testcase and via the errors attribute.
+        ([_suite("p", [ERROR], errors=1)], {"tests": 1, "failures": 1, "skipped": 0}, {"p/TestError": "fail"}),
+        # An XML declaration and a <testsuites> wrapper, split mid-element.
+        (
+            ['<?xml version="1.0"?><testsuites>' + _suite("p", [PASS, FAIL])[:40], _suite("p", [PASS, FAIL])[40:] + "</testsuites>"],
+            {"tests": 2, "failures": 1, "skipped": 0},
+            {"p/TestPass": "pass", "p/TestFail": "fail"},
+        ),
+        # Several top-level suites in one fragment.
+        (
+            [_suite("p", [PASS]), _suite("q", [SKIP], skipped=1)],
+            {"tests": 2, "failures": 0, "skipped": 1},
+            {"p/TestPass": "pass", "p/TestSkip": "skip"},
+        ),
+    ],
+    ids=["empty", "pass", "mixed", "error", "chunked", "several-suites"],
+)
+def test_feed(chunks, summary, outcomes):
+    tally = JUnitTally()
+    assert tally.feed("p", chunks)
+    assert tally.summary() == {**summary, "malformed": []}
+    assert tally.outcomes == outcomes
+
+
+def test_malformed_fragment_contributes_nothing():
+    tally = JUnitTally()
+    assert tally.feed("good", [_suite("p", [PASS, FAIL])])
+    assert not tally.feed("bad", [_suite("q", [PASS])[:-5]])
+    assert tally.summary() == {"tests": 2, "failures": 1, "skipped": 0, "malformed": ["bad"]}
+    assert "q/TestPass" not in tally.outcomes
+
+
+def test_failure_output_is_capped():
+    tally = JUnitTally()
+    cases = [
+        f'<testcase classname="p" name="Test{i}"><failure message="Failed">out {i}</failure></testcase>'
+        for i in range(MAX_FAILURE_OUTPUTS + 5)
+    ]
+    assert tally.feed("p", [_suite("p", cases)])
+    assert tally.failures == MAX_FAILURE_OUTPUTS + 5
+    assert len(tally.failure_output) == MAX_FAILURE_OUTPUTS
+    assert tally.failure_output["p/Test0"] == "out 0"
+
+
+def test_atomic_write_json(tmp_path):
+    path = tmp_path / "store" / "entry.json"
+    atomic_write_json(path, {"a": 1})
+    atomic_write_json(path, {"a": 2})
+    assert path.read_text() == '{"a": 2}'
+    assert path.stat().st_mode & 0o777 == 0o600
+    assert path.parent.stat().st_mode & 0o777 == 0o700
+    assert [p.name for p in path.parent.iterdir()] == ["entry.json"]